@@ -1,5 +1,6 @@
 #autopilot.py
 from pymavlink import mavutil
+import sys
 import time
 from enum import Enum
 import math
@@ -8,6 +9,8 @@ from threading import Thread
 from video import VideoManager, VisualizationType
 from optical_flow import OpticalFlowController
 from controllers import AltitudeController, PositionController
+from flight_recorder import FlightRecorder
+from telemetry import TelemetrySnapshot
 
 # ESP32 connection settings
 BROADCAST_IP = '255.255.255.255'  # Broadcast IP
@@ -40,8 +43,17 @@ class DroneCommands(Enum):
 
 ### WIFI CONTROLLER LIBRARY ###
 class WiFiController:
-    def __init__(self, ip="0.0.0.0", port=14550):
-        """Initialize connection to drone via ESP32."""
+    def __init__(self, ip="0.0.0.0", port=14550, video_sources=None, flow_source=None,
+                 headless=False):
+        """
+        Initialize connection to drone via ESP32.
+
+        video_sources maps camera names to device indices, e.g.
+        {"forward": 1, "down": 2}, with None for the auto-detected video
+        receiver (the default); flow_source names the camera used for
+        optical flow (default: the first one). headless runs the video
+        without a window (MJPEG preview and control socket instead).
+        """
         # For UDP connections, we need to specify 'udpin:' or 'udpout:'
         # udpin: means we're receiving on this port
         self.connection_string = f'udpin:{ip}:{port}'
@@ -54,6 +66,14 @@ class WiFiController:
         self.optical_flow = None
         self.position_controller = None
         self.altitude_controller = None
+        self.flight_recorder = None
+        self.telemetry = TelemetrySnapshot()
+        self.telemetry.listeners.append(self._on_telemetry)
+        self.baro_request_interval = 0.5  # Ask for VFR_HUD when the stream is this many seconds late
+        self.last_baro_request = 0.0
+        self.video_sources = video_sources or {"main": None}
+        self.flow_source = flow_source
+        self.headless = headless
         # MAVLink result codes for better error reporting
         self.result_codes = {
             mavutil.mavlink.MAV_RESULT_ACCEPTED: "ACCEPTED",
@@ -81,6 +101,7 @@ class WiFiController:
         try:
             # Establish initial connection
             self.vehicle = mavutil.mavlink_connection(self.connection_string)
+            self.telemetry.attach(self.vehicle)
             
             # Wait for heartbeat with timeout
             while time.time() - start_time < timeout:
@@ -96,6 +117,8 @@ class WiFiController:
                         4,  # 4 Hz
                         1   # Start
                     )
+                    # From here on only the reader thread calls recv_match
+                    self.telemetry.start_reader()
                     return True
                 
                 print(f"Waiting for heartbeat... {timeout - (time.time() - start_time):.1f}s remaining")
@@ -115,6 +138,8 @@ class WiFiController:
         """Safely disconnect from the drone."""
         # Stop all control systems
         self.stop_control_systems()
+        self.stop_recording()
+        self.telemetry.stop_reader()
 
         if self.video_manager:
             try:
@@ -154,6 +179,9 @@ class WiFiController:
 
         print("\n=== Pre-arm Check Results ===")
         
+        # Listen before asking, so the reply can't slip past
+        messages = self.telemetry.open_queue(['SYS_STATUS', 'STATUSTEXT'])
+
         # Request extended system status
         self.vehicle.mav.command_long_send(
             self.vehicle.target_system,
@@ -173,7 +201,7 @@ class WiFiController:
         errors_present = False
 
         while time.time() - start_time < 2:  # Check for 2 seconds
-            msg = self.vehicle.recv_match(blocking=True, timeout=1)
+            msg = messages.get(timeout=1)
             if msg is None:
                 continue
 
@@ -189,6 +217,7 @@ class WiFiController:
                     if "PreArm" in msg.text and ": " in msg.text:
                         self.prearm_failures.append(msg.text.split(": ")[1])
                         errors_present = True
+        messages.close()
 
         # Print collected information
         print("\n=== System Status ===")
@@ -231,25 +260,29 @@ class WiFiController:
 
         return not errors_present
 
+    def create_video_manager(self):
+        """Create a VideoManager for the configured cameras"""
+        return VideoManager(sources=self.video_sources, headless=self.headless)
+
     def initialize_video(self):
         """Initialize video manager and optical flow controller"""
         if self.video_manager is None:
-            self.video_manager = VideoManager(device_id=1)
+            self.video_manager = self.create_video_manager()
             if not self.video_manager.start():
                 raise RuntimeError("Failed to start video manager")
                 
         if self.optical_flow is None:
-            self.optical_flow = OpticalFlowController(self, self.video_manager)  # Pass self instead of self.vehicle
+            self.optical_flow = OpticalFlowController(self, self.video_manager, self.flow_source)  # Pass self instead of self.vehicle
 
     def initialize_controllers(self):
         """Initialize all control systems"""
         if self.video_manager is None:
-            self.video_manager = VideoManager(device_id=1)
+            self.video_manager = self.create_video_manager()
             if not self.video_manager.start():
                 raise RuntimeError("Failed to start video manager")
             
         if self.optical_flow is None:
-            self.optical_flow = OpticalFlowController(self, self.video_manager)
+            self.optical_flow = OpticalFlowController(self, self.video_manager, self.flow_source)
             
         if self.altitude_controller is None:
             self.altitude_controller = AltitudeController(self.vehicle)
@@ -260,6 +293,8 @@ class WiFiController:
         # Register observers with optical flow
         self.optical_flow.register_movement_observer(self.altitude_controller)
         self.optical_flow.register_movement_observer(self.position_controller)
+        if self.flight_recorder is not None:
+            self._attach_recorder()
 
     def start_control_systems(self, target_altitude=None):
         """Start all control systems"""
@@ -313,7 +348,7 @@ class WiFiController:
         # Wait for confirmation
         start_time = time.time()
         while time.time() - start_time < timeout:
-            msg = self.vehicle.recv_match(type='HEARTBEAT', blocking=True, timeout=0.5)
+            msg = self.telemetry.wait_for('HEARTBEAT', timeout=0.5)
             if msg:
                 custom_mode = msg.custom_mode
                 if custom_mode == mode.value:
@@ -357,7 +392,7 @@ class WiFiController:
         # Wait for confirmation
         start_time = time.time()
         while time.time() - start_time < timeout:
-            msg = self.vehicle.recv_match(type='HEARTBEAT', blocking=True, timeout=0.5)
+            msg = self.telemetry.wait_for('HEARTBEAT', timeout=0.5)
             if msg:
                 if msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED:
                     print("✓ Drone armed successfully")
@@ -395,7 +430,7 @@ class WiFiController:
         # Wait for confirmation
         start_time = time.time()
         while time.time() - start_time < timeout:
-            msg = self.vehicle.recv_match(type='HEARTBEAT', blocking=True, timeout=0.5)
+            msg = self.telemetry.wait_for('HEARTBEAT', timeout=0.5)
             if msg:
                 if not (msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED):
                     print("✓ Drone disarmed successfully")
@@ -412,15 +447,10 @@ class WiFiController:
             self.initialize_controllers()
             
             print("Starting takeoff sequence...")
-            while self.vehicle.recv_match(blocking=False):
-                pass
-            
             print("Performing pre-flight checks...")
-            while self.vehicle.recv_match(blocking=False):
-                pass
             
             # Check if already armed
-            msg = self.vehicle.recv_match(type='HEARTBEAT', blocking=True)
+            msg = self.telemetry.wait_for('HEARTBEAT')
             if not msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED:
                 print("Sending arm command...")
                 if not self.arm():
@@ -440,7 +470,8 @@ class WiFiController:
             max_vertical_speed = 0.5
             
             while True:
-                msg = self.vehicle.recv_match(type='GLOBAL_POSITION_INT', blocking=True)
+                msg = self.telemetry.wait_for('GLOBAL_POSITION_INT')
+                self._record_telemetry(msg)
                 current_altitude = msg.relative_alt / 1000.0
                 
                 vertical_speed = (current_altitude - prev_altitude) / 0.1
@@ -504,7 +535,7 @@ class WiFiController:
             print("\nInitiating landing sequence...")
             
             # Get current altitude
-            msg = self.vehicle.recv_match(type='GLOBAL_POSITION_INT', blocking=True)
+            msg = self.telemetry.wait_for('GLOBAL_POSITION_INT')
             if msg:
                 current_alt = msg.relative_alt / 1000.0  # Convert mm to meters
                 print(f"Starting landing from {current_alt:.1f}m")
@@ -540,6 +571,58 @@ class WiFiController:
             print(f"Landing failed: {str(e)}")
             return False
 
+### FLIGHT RECORDING ###
+    def start_recording(self, output_dir="flights", recorder=None):
+        """
+        Record video, MAVLink telemetry and optical flow output for this
+        flight, into recorder (a started FlightRecorder) if given
+        """
+        if recorder is not None and recorder is not self.flight_recorder:
+            self.stop_recording()
+            self.flight_recorder = recorder
+        if self.flight_recorder is None:
+            self.flight_recorder = FlightRecorder(output_dir).start()
+        self._attach_recorder()
+        return self.flight_recorder
+
+    def stop_recording(self):
+        """Stop and close the flight recording, if any"""
+        if self.flight_recorder is None:
+            return
+        if self.video_manager:
+            self.video_manager.stop_recording()
+        if self.optical_flow:
+            self.optical_flow.remove_movement_observer(self.flight_recorder)
+        self.flight_recorder.stop()
+        self.flight_recorder = None
+
+    def record_decision(self, instruction):
+        """Record a flight instruction alongside the video; InstructionExecutor calls this for each one it flies"""
+        if self.flight_recorder is not None:
+            self.flight_recorder.record_event("instruction", instruction)
+        if self.video_manager:
+            # The target layer shows where the current instruction is flying to, if anywhere
+            if "g" in instruction:
+                target, distance = instruction["g"]
+                self.video_manager.update_target_overlay(tuple(target), f"{distance} m")
+            else:
+                self.video_manager.update_target_overlay(None)
+
+    def _attach_recorder(self):
+        if self.video_manager:
+            self.video_manager.start_recording(self.flight_recorder)
+        if self.optical_flow and self.flight_recorder not in self.optical_flow.movement_observers:
+            self.optical_flow.register_movement_observer(self.flight_recorder)
+
+    def _record_telemetry(self, msg):
+        if self.flight_recorder is not None:
+            self.flight_recorder.record_mavlink(msg)
+
+    def _on_telemetry(self, msg):
+        # Barometer messages are no longer requested explicitly; record them as they stream in
+        if msg.get_type() in ('VFR_HUD', 'SCALED_PRESSURE'):
+            self._record_telemetry(msg)
+
 ### TELEMETRY ###
     def get_altitude(self) -> float:
         """
@@ -548,57 +631,48 @@ class WiFiController:
         Returns:
             float: Current altitude in meters, or -1 if not available
         """
-        msg = self.vehicle.recv_match(type='LOCAL_POSITION_NED', blocking=True, timeout=1)
+        msg = self.telemetry.wait_for('LOCAL_POSITION_NED', timeout=1)
         if msg:
+            self._record_telemetry(msg)
             return -msg.z  # Convert NED to altitude
         return -1
 
-    def get_barometer_data(self) -> dict:
+    def get_barometer_data(self, max_age=None) -> dict:
         """
-        Get barometric data from the drone.
+        Get barometric data from the drone's streamed telemetry, without
+        blocking. If the VFR_HUD stream has fallen behind, one is requested
+        (at most every baro_request_interval); the reply arrives through the
+        reader thread for a later call.
         
         Returns:
-            dict: Contains 'altitude' (m), 'pressure' (hPa), and 'temperature' (C)
+            dict: Contains 'altitude' (m) and 'timestamp' (when it was received),
+            or None if no VFR_HUD has arrived (within max_age seconds)
         """
         if not self.connected or not self.vehicle:
             return None
-            
-        # Request VFR_HUD message which contains altitude
-        self.vehicle.mav.command_long_send(
-            self.vehicle.target_system,
-            self.vehicle.target_component,
-            mavutil.mavlink.MAV_CMD_REQUEST_MESSAGE,
-            0,
-            mavutil.mavlink.MAVLINK_MSG_ID_VFR_HUD,
-            0, 0, 0, 0, 0, 0
-        )
-        
-        # Wait for messages
-        start_time = time.time()
-        while time.time() - start_time < 0.5:  # 500ms timeout
-            msg = self.vehicle.recv_match(type=['VFR_HUD', 'SCALED_PRESSURE'], blocking=True, timeout=0.1)
-            if msg is None:
-                continue
-                
-            if msg.get_type() == 'VFR_HUD':
-                alt = msg.alt
-                break
-        else:
-            return None
-            
-        return {
-            'altitude': alt,  # Altitude in meters
-            'timestamp': time.time()
-        }
+        now = time.time()
+        if (self.telemetry.barometer(self.baro_request_interval) is None
+                and now - self.last_baro_request >= self.baro_request_interval):
+            self.last_baro_request = now
+            self.vehicle.mav.command_long_send(
+                self.vehicle.target_system,
+                self.vehicle.target_component,
+                mavutil.mavlink.MAV_CMD_REQUEST_MESSAGE,
+                0,
+                mavutil.mavlink.MAVLINK_MSG_ID_VFR_HUD,
+                0, 0, 0, 0, 0, 0
+            )
+        return self.telemetry.barometer(max_age)
 
 ### IN-FLIGHT COMMANDS ###
-    def rotate(self, degrees: float, timeout: float = 5.0) -> bool:
+    def rotate(self, degrees: float, timeout: float = 5.0, cancel_event=None) -> bool:
         """
         Rotate the drone left (negative) or right (positive) by specified degrees.
         
         Args:
             degrees (float): Degrees to rotate (positive for right, negative for left)
             timeout (float): Maximum time to wait for rotation completion
+            cancel_event (threading.Event): Optional event that aborts the rotation when set
         
         Returns:
             bool: True if rotation completed, False otherwise
@@ -625,7 +699,22 @@ class WiFiController:
         )
         
         # Wait for rotation to complete
-        time.sleep(duration)
+        if cancel_event is None:
+            time.sleep(duration)
+            return True
+
+        if cancel_event.wait(duration):
+            # Hold the current heading instead of finishing the turn
+            self.vehicle.mav.command_long_send(
+                self.vehicle.target_system,
+                self.vehicle.target_component,
+                mavutil.mavlink.MAV_CMD_CONDITION_YAW,
+                0,
+                0, yaw_rate, direction, 1,
+                0, 0, 0
+            )
+            print("Rotation cancelled")
+            return False
         return True
 
     def move_forward_quick(self, meters: float, velocity: float = 0.5) -> bool:
@@ -668,7 +757,8 @@ class WiFiController:
         return True
 
     def move_forward_precise(self, meters: float, velocity: float = 0.5, 
-                            timeout: float = 10.0, error_threshold: float = 0.2) -> dict:
+                            timeout: float = 10.0, error_threshold: float = 0.2,
+                            cancel_event=None) -> dict:
         """
         Precise forward movement using both time estimation and position feedback.
         
@@ -677,6 +767,7 @@ class WiFiController:
             velocity (float): Movement speed in m/s
             timeout (float): Maximum time allowed for movement
             error_threshold (float): Acceptable error margin in meters
+            cancel_event (threading.Event): Optional event that stops the movement when set
             
         Returns:
             dict: Movement results including:
@@ -694,7 +785,7 @@ class WiFiController:
         
         # Get starting position
         start_pos = None
-        msg = self.vehicle.recv_match(type='LOCAL_POSITION_NED', blocking=True, timeout=1)
+        msg = self.telemetry.wait_for('LOCAL_POSITION_NED', timeout=1)
         if msg:
             start_pos = (msg.x, msg.y)
         else:
@@ -713,12 +804,26 @@ class WiFiController:
 
         # Monitor both time and position
         while time.time() - start_time < timeout:
+            if cancel_event is not None and cancel_event.is_set():
+                self.vehicle.mav.set_position_target_local_ned_send(
+                    0, self.vehicle.target_system, self.vehicle.target_component,
+                    mavutil.mavlink.MAV_FRAME_BODY_OFFSET_NED,
+                    0b0000111111000111,
+                    0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0
+                )
+                return {
+                    "success": False,
+                    "error": "Movement cancelled",
+                    "time_estimated_distance": time_estimated_distance,
+                    "duration": time.time() - start_time
+                }
+
             current_time = time.time()
             elapsed_time = current_time - start_time
             time_estimated_distance = velocity * elapsed_time
             
             # Get current position
-            msg = self.vehicle.recv_match(type='LOCAL_POSITION_NED', blocking=True, timeout=0.1)
+            msg = self.telemetry.wait_for('LOCAL_POSITION_NED', timeout=0.1)
             if msg:
                 current_pos = (msg.x, msg.y)
                 ned_measured_distance = ((current_pos[0] - start_pos[0])**2 + 
@@ -773,6 +878,27 @@ class WiFiController:
             "duration": time.time() - start_time
         }
 
+    def elevate(self, meters: float) -> bool:
+        """
+        Raise (positive) or lower (negative) the altitude hold target.
+        
+        Args:
+            meters (float): Change in target altitude in meters
+            
+        Returns:
+            bool: True if the new target was accepted
+        """
+        if not self.connected or not self.vehicle:
+            return False
+        if not self.altitude_controller or not self.altitude_controller.running:
+            print("Altitude controller not running, cannot elevate")
+            return False
+
+        new_target = max(0.3, self.altitude_controller.target_altitude + meters)
+        self.altitude_controller.set_target_altitude(new_target)
+        print(f"Target altitude set to {new_target:.2f}m")
+        return True
+
     def start_position_hold(self):
         """Start position holding using optical flow"""
         if not self.video_manager or not self.optical_flow:
@@ -835,7 +961,7 @@ class WiFiController:
         print("Please center throttle stick (~1500)")
         
         while True:
-            msg = self.vehicle.recv_match(type='RC_CHANNELS', blocking=True)
+            msg = self.telemetry.wait_for('RC_CHANNELS')
             rc_throttle = msg.chan3_raw
             print(f"Current RC throttle: {rc_throttle}")
             
@@ -874,12 +1000,14 @@ def print_commands():
     print("  status   - Print current drone status")
     print("  video    - Start video feed with optical flow visualization")
     print("  stopvideo- Stop video feed")
+    print("  record   - Start recording video, telemetry and flow")
+    print("  stoprec  - Stop recording")
     print("  help     - Show this command list")
     print("  exit     - Safely land and exit")
 
 def application():
     try:
-        with WiFiController() as drone:
+        with WiFiController(headless="--headless" in sys.argv) as drone:
             print("\n=== Drone Control Interface ===")
             print("Connected to drone. Type 'help' for commands.")
             
@@ -940,7 +1068,7 @@ def application():
                                 drone.video_manager = None
                             
                             # Initialize new video manager
-                            drone.video_manager = VideoManager(device_id=1)
+                            drone.video_manager = drone.create_video_manager()
                             
                             # Start optical flow first
                             drone.initialize_controllers()
@@ -983,12 +1111,20 @@ def application():
                         #except ValueError:
                             #print("Please enter a valid number")
                             
+                    elif command == "record":
+                        recorder = drone.start_recording()
+                        print(f"Recording flight to {recorder.path}")
+
+                    elif command == "stoprec":
+                        drone.stop_recording()
+                        print("Recording stopped")
+
                     elif command == "status":
                         altitude = drone.get_altitude()
                         print(f"\nCurrent Status:")
                         print(f"Altitude: {altitude:.2f}m")
                         print(f"Motors Armed: {drone.vehicle.motors_armed()}")
-                        msg = drone.vehicle.recv_match(type='HEARTBEAT', blocking=True, timeout=0.5)
+                        msg = drone.telemetry.wait_for('HEARTBEAT', timeout=0.5)
                         if msg:
                             current_mode = next((mode for mode in FlightMode if mode.value == msg.custom_mode), None)
                             print(f"Flight Mode: {current_mode.name if current_mode else 'Unknown'}")
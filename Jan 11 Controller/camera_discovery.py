@@ -0,0 +1,199 @@
+#camera_discovery.py
+import cv2
+import glob
+import json
+import os
+import sys
+import time
+from threading import Thread
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "astar", "cameras.json")
+
+# Device name fragments of FPV video receivers / capture dongles vs. laptop webcams
+# (generic USB/UVC names are left out: ordinary webcams use them too)
+RECEIVER_HINTS = ("skydroid", "receiver", "fpv", "capture", "av to usb")
+BUILTIN_HINTS = ("facetime", "integrated", "built-in", "internal", "webcam")
+
+# Resolutions tried when recording a device's supported modes
+PROBE_MODES = ((640, 480), (1280, 720), (1920, 1080))
+
+
+def _read_text(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _fourcc_name(value):
+    value = int(value)
+    name = "".join(chr((value >> 8 * i) & 0xFF) for i in range(4))
+    return name if name.isprintable() and name.strip() else None
+
+
+def list_device_nodes(max_index=10):
+    """
+    Candidate capture devices as (index, path, name). On Linux these come
+    from /dev/video*, with the stable /dev/v4l/by-id link as the path when
+    there is one; elsewhere indices 0..max_index-1 are assumed, with
+    "index:N" as the path and no name.
+    """
+    devices = glob.glob("/dev/video[0-9]*") if sys.platform.startswith("linux") else []
+    if not devices:
+        return [(i, f"index:{i}", None) for i in range(max_index)]
+
+    by_id = {os.path.realpath(link): link for link in glob.glob("/dev/v4l/by-id/*")}
+    nodes = []
+    for device in sorted(devices, key=lambda d: int(d[len("/dev/video"):])):
+        index = int(device[len("/dev/video"):])
+        name = _read_text(f"/sys/class/video4linux/video{index}/name")
+        nodes.append((index, by_id.get(device, device), name))
+    return nodes
+
+
+def probe_device(index, path=None, name=None, probe_modes=True):
+    """Open one device, grab a frame and record what it delivers"""
+    start = time.time()
+    info = {"index": index, "path": path or f"index:{index}", "name": name,
+            "ok": False, "probed_at": start}
+    cap = cv2.VideoCapture(index)
+    try:
+        if not cap.isOpened():
+            return info
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            return info
+        info.update(
+            ok=True,
+            width=frame.shape[1],
+            height=frame.shape[0],
+            fps=cap.get(cv2.CAP_PROP_FPS),
+            backend=cap.getBackendName(),
+            fourcc=_fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)),
+        )
+        if probe_modes:
+            modes = []
+            for width, height in PROBE_MODES:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+                if (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))) == (width, height):
+                    modes.append({"width": width, "height": height,
+                                  "fps": cap.get(cv2.CAP_PROP_FPS),
+                                  "fourcc": _fourcc_name(cap.get(cv2.CAP_PROP_FOURCC))})
+            info["modes"] = modes
+        return info
+    finally:
+        cap.release()
+        info["probe_ms"] = (time.time() - start) * 1000.0
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_path, cache):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write camera cache {cache_path}: {e}")
+
+
+def discover_cameras(timeout=3.0, max_index=10, cache_path=DEFAULT_CACHE_PATH,
+                     refresh=False, max_age=7 * 24 * 3600, failure_max_age=60.0, index_max_age=60.0,
+                     probe_modes=True):
+    """
+    Probe every candidate device in parallel and return one info dict per
+    device, sorted by index (see probe_device; "ok" is True for devices
+    that delivered a frame).
+
+    Results are cached on disk keyed by device path, so a restart only
+    probes devices it hasn't seen within max_age. Failed probes (device
+    busy, no signal yet) are only trusted for failure_max_age seconds. A
+    device that doesn't answer within timeout is reported with "timeout":
+    True and retried on the next call; its probe thread is left to finish
+    in the background.
+    Devices without a stable path ("index:N") are only cached when they
+    worked, and only for index_max_age seconds: indices shift when devices
+    are plugged or unplugged.
+    """
+    cache = {} if cache_path is None else _load_cache(cache_path)
+    now = time.time()
+    results = {}
+    probes = []
+    for index, path, name in list_device_nodes(max_index):
+        entry = cache.get(path)
+        if not (entry and entry.get("ok")):
+            entry_max_age = failure_max_age
+        elif path.startswith("index:"):
+            entry_max_age = index_max_age
+        else:
+            entry_max_age = max_age
+        if (not refresh and entry and entry.get("index") == index
+                and now - entry.get("probed_at", 0) < entry_max_age):
+            results[path] = dict(entry, cached=True)
+            continue
+
+        result = {}
+        thread = Thread(target=lambda i=index, p=path, n=name, r=result:
+                        r.update(probe_device(i, p, n, probe_modes)),
+                        name=f"camera-probe-{index}", daemon=True)
+        thread.start()
+        probes.append((thread, index, path, name, result))
+
+    deadline = time.time() + timeout
+    for thread, index, path, name, result in probes:
+        thread.join(max(0.0, deadline - time.time()))
+        if thread.is_alive():
+            results[path] = {"index": index, "path": path, "name": name, "ok": False,
+                             "timeout": True, "probed_at": now}
+            continue
+        results[path] = result
+        if result["ok"] or not path.startswith("index:"):
+            cache[path] = result
+
+    if cache_path is not None and probes:
+        _save_cache(cache_path, cache)
+    return sorted(results.values(), key=lambda info: info["index"])
+
+
+def pick_receiver(cameras):
+    """
+    The working device most likely to be the video receiver: a name that
+    looks like a receiver or capture dongle wins, built-in webcams lose,
+    and otherwise the highest index (external devices enumerate after the
+    built-in camera).
+    """
+    working = [c for c in cameras if c.get("ok")]
+    if not working:
+        return None
+
+    def score(camera):
+        name = (camera.get("name") or "").lower()
+        return (any(hint in name for hint in RECEIVER_HINTS),
+                not any(hint in name for hint in BUILTIN_HINTS),
+                camera["index"])
+
+    return max(working, key=score)
+
+
+def find_receiver(fallback=1, **kwargs):
+    """Device index of the video receiver, or fallback if no working device was found"""
+    start = time.time()
+    cameras = discover_cameras(**kwargs)
+    receiver = pick_receiver(cameras)
+    if receiver is None:
+        print(f"No working video device found, falling back to device {fallback}")
+        return fallback
+    print(f"Using video device {receiver['index']} ({receiver.get('name') or receiver['path']}, "
+          f"{receiver.get('width')}x{receiver.get('height')}) "
+          f"- discovery took {(time.time() - start) * 1000:.0f}ms")
+    return receiver["index"]
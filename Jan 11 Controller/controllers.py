@@ -31,22 +31,24 @@ class AltitudeController:
 
         # Periodic barometer check interval
         self.baro_check_interval = 0.1  # seconds
+        self.max_baro_age = 1.0  # Older barometer readings are ignored (seconds)
         
-    def on_movement(self, movement_data):
-        """Receive movement updates from optical flow"""
-        if not self.running or movement_data['is_takeoff']:
+    def on_movement(self, movement):
+        """Receive movement updates (MovementSample) from optical flow"""
+        if not self.running or movement.is_takeoff:
             return
         
-        current_time = movement_data['timestamp']
+        current_time = movement.timestamp
 
-        # Get barometer reading periodically
-        baro_data = movement_data.get('baro_data')
-        if baro_data:
+        # Get barometer reading periodically, if it is fresh enough
+        baro_data = movement.baro_data
+        baro_fresh = bool(baro_data) and (movement.baro_age is None or movement.baro_age <= self.max_baro_age)
+        if baro_fresh:
             self.update_from_barometer(baro_data)
             self.last_baro_update = current_time
         
         # Update based on optical flow scale changes
-        scale_change = movement_data['scale']
+        scale_change = movement.scale
 
         # Apply exponential smoothing to scale change
         self.smoothed_scale = (self.alpha_scale * scale_change + 
@@ -55,8 +57,9 @@ class AltitudeController:
         # Calculate correction
         optical_correction = -scale_change * self.kp_optical
         
-        # Combine barometer and optical flow corrections
-        if self.last_baro_altitude is not None:
+        # Combine barometer and optical flow corrections; with a stale (or no)
+        # reading, use optical flow alone
+        if baro_fresh and self.last_baro_altitude is not None:
             baro_error = self.target_altitude - self.last_baro_altitude
             self.integral_error += baro_error * (current_time - self.last_baro_update)
             baro_correction = (baro_error * self.kp_alt + 
@@ -79,7 +82,7 @@ class AltitudeController:
         else:
             throttle = self.base_throttle  # Stay in deadzone
         
-        self.last_optical_update = movement_data['timestamp']
+        self.last_optical_update = movement.timestamp
         
         # Send the RC command
         self.vehicle.mav.rc_channels_override_send(
@@ -125,15 +128,19 @@ class PositionController:
         # Control parameters
         self.kp_xy = 0.3
         self.max_correction = 100
+        self.min_inlier_ratio = 0.5  # Below this the flow fit is not trusted
         
-    def on_movement(self, movement_data):
-        """Receive movement updates from optical flow"""
+    def on_movement(self, movement):
+        """Receive movement updates (MovementSample) from optical flow"""
         if not self.running:
             return
             
-        # Calculate position corrections
-        x_correction = int(-movement_data['x'] * self.kp_xy)
-        y_correction = int(-movement_data['y'] * self.kp_xy)
+        # Calculate position corrections, centring the sticks when the flow estimate is unreliable
+        x_correction = int(-movement.x * self.kp_xy)
+        y_correction = int(-movement.y * self.kp_xy)
+        inlier_ratio = movement.inlier_ratio
+        if inlier_ratio is not None and inlier_ratio < self.min_inlier_ratio:
+            x_correction = y_correction = 0
         
         # Apply corrections
         roll = 1500 + np.clip(x_correction, -self.max_correction, self.max_correction)
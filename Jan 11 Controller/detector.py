@@ -0,0 +1,290 @@
+#detector.py
+import os
+import hashlib
+import time
+import numpy as np
+from collections import OrderedDict
+from threading import Thread, Event, Lock
+
+try:
+    from ultralytics import YOLOWorld
+    YOLO_AVAILABLE = True
+except ImportError:
+    YOLO_AVAILABLE = False
+    print("Warning: ultralytics is not installed. YOLO features will be unavailable.")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "astar", "yolo_world")
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of YOLO-World text embeddings, one file per
+    (model weights, vocabulary) pair, so a restart with the same class list
+    skips the CLIP text-encoder pass.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _path(self, model_hash, classes):
+        vocab_hash = hashlib.sha1("\n".join(classes).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{model_hash[:16]}-{vocab_hash[:16]}.pt")
+
+    def load(self, model_hash, classes):
+        """Cached txt_feats tensor for this model and vocabulary, or None"""
+        import torch
+        path = self._path(model_hash, classes)
+        if not os.path.exists(path):
+            return None
+        try:
+            entry = torch.load(path, map_location="cpu")
+        except Exception as e:
+            print(f"Ignoring unreadable embedding cache {path}: {e}")
+            return None
+        # Guard against hash collisions
+        if entry.get("classes") != list(classes):
+            return None
+        return entry["txt_feats"]
+
+    def save(self, model_hash, classes, txt_feats):
+        import torch
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(model_hash, classes)
+        tmp_path = path + ".tmp"
+        torch.save({"classes": list(classes), "txt_feats": txt_feats.detach().cpu()}, tmp_path)
+        os.replace(tmp_path, path)
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-1 of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WorldDetector:
+    """
+    YOLO-World model that loads, sets its vocabulary and warms up on a
+    background thread, so capture and optical flow can start immediately.
+    `model` stays None until the detector is ready to predict.
+
+    The vocabulary can be switched at runtime with set_classes() without
+    reloading weights. Per-class text embeddings are kept in an LRU cache,
+    so only classes never seen before go through the text encoder, and
+    the swap itself is a pointer exchange between two predict calls.
+    """
+    def __init__(self, weights="yolov8s-world.pt", classes=("person", "bus"),
+                 cache_dir=DEFAULT_CACHE_DIR, warmup_shape=(720, 1280, 3), debug=True,
+                 max_cached_classes=256):
+        self.weights = weights
+        self.classes = list(classes)
+        self.embedding_cache = EmbeddingCache(cache_dir)
+        self.warmup_shape = warmup_shape
+        self.debug = debug
+
+        self.model = None
+        self.model_hash = None
+        self.ready = Event()
+        self.error = None
+        self.thread = None
+
+        # predict_lock keeps a vocabulary swap from landing mid-predict
+        self.predict_lock = Lock()
+        self.switch_lock = Lock()
+        # Latest set_classes(block=False) request not yet started, and the one
+        # worker that applies them; older pending requests are replaced
+        self.pending_lock = Lock()
+        self.pending_switch = None  # (classes, on_done, requested)
+        self.switch_thread = None
+        self.class_embeddings = OrderedDict()  # LRU: class name -> embedding row
+        self.max_cached_classes = max_cached_classes
+        self.last_switch = None
+
+    def load_async(self):
+        """Start loading in the background; returns immediately"""
+        if self.thread is None:
+            self.thread = Thread(target=self._load, name="yolo-loader", daemon=True)
+            self.thread.start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """Block until the model is ready (or loading failed); returns True if ready"""
+        self.ready.wait(timeout)
+        return self.model is not None
+
+    def _load(self):
+        start = time.time()
+        try:
+            # Initialize a YOLO-World model
+            model = YOLOWorld(self.weights)
+            weights_path = getattr(model, "ckpt_path", None) or self.weights
+            if os.path.exists(weights_path):
+                self.model_hash = hash_file(weights_path)
+            else:
+                self.model_hash = hashlib.sha1(str(weights_path).encode("utf-8")).hexdigest()
+            loaded = time.time()
+
+            # Define custom classes, reusing cached text embeddings when possible
+            cached = self._set_classes(model, self.classes)
+            vocab_ready = time.time()
+
+            # The first predict call builds the inference graph; pay for it here
+            model.predict(np.zeros(self.warmup_shape, dtype=np.uint8), verbose=False)
+
+            self.model = model
+            if self.debug:
+                print(f"YOLOWorld model loaded successfully in {time.time() - start:.2f}s "
+                      f"(weights {loaded - start:.2f}s, vocabulary {vocab_ready - loaded:.2f}s"
+                      f"{' from cache' if cached else ''}, warm-up {time.time() - vocab_ready:.2f}s)")
+        except Exception as e:
+            self.error = e
+            print(f"Failed to load YOLOWorld model: {e}")
+        finally:
+            self.ready.set()
+
+    def predict(self, frames):
+        """Run the model on a list of frames with the current vocabulary"""
+        with self.predict_lock:
+            return self.model.predict(list(frames), verbose=False)
+
+    def set_classes(self, classes, block=False, on_done=None):
+        """
+        Switch the vocabulary without reloading weights. Unless block is
+        set, any text encoding happens on a background thread and
+        detection carries on with the old classes until the swap. on_done
+        receives the switch report (see _switch).
+
+        Requests are applied in order and the last one always wins: a
+        request that is superseded before it starts is dropped, and its
+        on_done receives None.
+        """
+        classes = list(classes)
+        with self.pending_lock:
+            superseded = self.pending_switch
+            self.pending_switch = None if block else (classes, on_done, time.time())
+            if not block and self.switch_thread is None:
+                self.switch_thread = Thread(target=self._switch_worker, name="yolo-vocabulary", daemon=True)
+                self.switch_thread.start()
+        if superseded is not None and superseded[1]:
+            superseded[1](None)
+        if block:
+            return self._switch(classes, on_done)
+        return None
+
+    def _switch_worker(self):
+        """Apply pending vocabulary requests one at a time until none is left"""
+        while True:
+            with self.pending_lock:
+                request = self.pending_switch
+                self.pending_switch = None
+                if request is None:
+                    self.switch_thread = None
+                    return
+            self._switch(*request)
+
+    def _switch(self, classes, on_done=None, requested=None):
+        requested = time.time() if requested is None else requested
+        with self.switch_lock:
+            if not self.ready.is_set():
+                # Still loading: the loader will pick this vocabulary up
+                self.classes = classes
+            if not self.wait_ready():
+                return None
+            start = time.time()
+
+            import torch
+            missing = [c for c in classes if c not in self.class_embeddings]
+            encoded = []
+            if missing:
+                txt_feats = self.embedding_cache.load(self.model_hash, classes)
+                if txt_feats is not None:
+                    self._remember(classes, txt_feats)
+                    missing = []
+            if missing:
+                self._remember(missing, self._encode(missing))
+                encoded = missing
+
+            rows = [self.class_embeddings[c] for c in classes]
+            for c in classes:
+                self.class_embeddings.move_to_end(c)
+            txt_feats = torch.stack(rows).unsqueeze(0)
+
+            with self.predict_lock:
+                self._install_embeddings(self.model, classes, txt_feats)
+            self.classes = classes
+            self._evict()
+
+            if encoded:
+                try:
+                    self.embedding_cache.save(self.model_hash, classes, txt_feats)
+                except Exception as e:
+                    print(f"Could not cache text embeddings: {e}")
+
+        report = {
+            "classes": classes,
+            "latency_ms": (time.time() - requested) * 1000.0,
+            "switch_ms": (time.time() - start) * 1000.0,
+            "encoded": encoded,
+            "cached": len(classes) - len(encoded),
+        }
+        self.last_switch = report
+        if self.debug:
+            print(f"YOLO vocabulary switched to {classes} in {report['latency_ms']:.1f}ms "
+                  f"({report['cached']} cached, {len(encoded)} encoded)")
+        if on_done:
+            on_done(report)
+        return report
+
+    def _encode(self, classes):
+        """Text embeddings for classes, one row per class"""
+        world = self.model.model
+        get_text_pe = getattr(world, "get_text_pe", None)
+        if get_text_pe is not None:
+            txt_feats = get_text_pe(list(classes))
+        else:
+            # Older ultralytics only encodes through set_classes, which swaps the
+            # live vocabulary; do it between predicts and put the old one back
+            with self.predict_lock:
+                saved = (world.txt_feats, world.model[-1].nc)
+                world.set_classes(list(classes))
+                txt_feats = world.txt_feats
+                world.txt_feats, world.model[-1].nc = saved
+        return txt_feats.reshape(-1, txt_feats.shape[-1]).detach().cpu()
+
+    def _remember(self, classes, txt_feats):
+        """Add per-class embedding rows to the LRU cache"""
+        rows = txt_feats.reshape(-1, txt_feats.shape[-1]).detach().cpu()
+        for c, row in zip(classes, rows):
+            self.class_embeddings[c] = row
+            self.class_embeddings.move_to_end(c)
+
+    def _evict(self):
+        while len(self.class_embeddings) > self.max_cached_classes:
+            self.class_embeddings.popitem(last=False)
+
+    def _set_classes(self, model, classes):
+        """Set the vocabulary; returns True if the embeddings came from the disk cache"""
+        txt_feats = self.embedding_cache.load(self.model_hash, classes)
+        if txt_feats is not None:
+            self._install_embeddings(model, classes, txt_feats)
+            self._remember(classes, txt_feats)
+            return True
+
+        model.set_classes(list(classes))
+        self._remember(classes, model.model.txt_feats)
+        try:
+            self.embedding_cache.save(self.model_hash, classes, model.model.txt_feats)
+        except Exception as e:
+            print(f"Could not cache text embeddings: {e}")
+        return False
+
+    @staticmethod
+    def _install_embeddings(model, classes, txt_feats):
+        """Equivalent of YOLOWorld.set_classes with precomputed embeddings"""
+        world = model.model
+        world.txt_feats = txt_feats.to(next(world.parameters()).device)
+        world.model[-1].nc = len(classes)
+        world.names = list(classes)
+        if model.predictor:
+            model.predictor.model.names = list(classes)
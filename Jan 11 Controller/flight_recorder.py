@@ -0,0 +1,359 @@
+#flight_recorder.py
+import cv2
+import numpy as np
+import os
+import json
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from threading import Thread, Lock
+from queue import Queue, Empty
+from frame_data import FrameData
+
+
+def _to_json(value):
+    """json.dumps fallback for numpy values and other odd types"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class FlightRecorder:
+    """
+    Background recorder for video, telemetry and decisions.
+
+    A flight is written to one directory:
+        video_0000.mjpg, video_0001.mjpg, ...  concatenated JPEG frames,
+                                              rolled every segment_seconds
+        index.jsonl                           one time-stamped line per frame
+                                              (segment, byte offset, length)
+                                              and per event (telemetry, flow,
+                                              instructions, ...)
+
+    All encoding and disk I/O happens on the writer thread. The record_*
+    calls only enqueue and never block: at most queue_size frames (and
+    save_jpeg images) and event_queue_size events wait at a time, and if
+    the writer falls behind, further ones are dropped (and counted).
+    """
+    def __init__(self, output_dir="flights", name=None, jpeg_quality=85,
+                 max_fps=None, segment_seconds=60.0, queue_size=64, event_queue_size=4096):
+        name = name or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(output_dir, name)
+        self.jpeg_quality = jpeg_quality
+        self.min_frame_interval = 1.0 / max_fps if max_fps else 0.0
+        self.segment_seconds = segment_seconds
+
+        # Never full, so producers never wait; pending_frames / pending_events
+        # bound what it holds
+        self.queue = Queue()
+        self.queue_size = queue_size
+        self.event_queue_size = event_queue_size
+        self.pending_frames = 0
+        self.pending_events = 0
+        self.running = False
+        self.thread = None
+        self.lock = Lock()
+        self.last_frame_time = 0.0
+
+        # Stats
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.events_written = 0
+        self.events_dropped = 0
+
+        # Writer-thread state
+        self.segment_index = -1
+        self.segment_file = None
+        self.segment_started = 0.0
+        self.index_file = None
+
+    def start(self):
+        """Create the flight directory and start the writer thread"""
+        if self.running:
+            return self
+        os.makedirs(self.path, exist_ok=True)
+        self.index_file = open(os.path.join(self.path, "index.jsonl"), "a")
+        self.running = True
+        self.thread = Thread(target=self._writer_loop, daemon=True)
+        self.thread.start()
+        print(f"Flight recorder writing to {self.path}")
+        return self
+
+    def stop(self):
+        """Flush everything queued so far and close the flight"""
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.segment_file:
+            self.segment_file.close()
+            self.segment_file = None
+        if self.index_file:
+            self.index_file.close()
+            self.index_file = None
+        print(f"Flight recorder stopped: {self.frames_written} frames, "
+              f"{self.events_written} events, {self.frames_dropped} frames and "
+              f"{self.events_dropped} events dropped")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # -----------------------------
+    # Producer side (any thread)
+    # -----------------------------
+    def record_frame(self, frame, timestamp=None, seq=None):
+        """
+        Queue a frame for the video stream. The frame must not be modified
+        afterwards. Given a FrameData, its capture timestamp and index are
+        used, so as a VideoManager subscriber (frame_data=True) frames line
+        up with telemetry however late the callback runs.
+        """
+        if not self.running:
+            return
+        if isinstance(frame, FrameData):
+            timestamp = frame.timestamp if timestamp is None else timestamp
+            seq = frame.index if seq is None else seq
+            frame = frame.frame
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self.lock:
+            if timestamp - self.last_frame_time < self.min_frame_interval:
+                return
+            self.last_frame_time = timestamp
+        if self._reserve_frame():
+            self.queue.put_nowait(("frame", timestamp, seq, frame))
+
+    def record_event(self, kind, data, timestamp=None):
+        """Queue a time-stamped event (telemetry, flow, instruction, ...)"""
+        if not self.running:
+            return
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self.lock:
+            if self.pending_events >= self.event_queue_size:
+                self.events_dropped += 1
+                return
+            self.pending_events += 1
+        self.queue.put_nowait(("event", timestamp, kind, data))
+
+    def record_mavlink(self, msg):
+        """Queue a MAVLink message as a telemetry event keyed by its type"""
+        if msg is None:
+            return
+        data = msg.to_dict()
+        self.record_event(f"mavlink.{data.pop('mavpackettype', msg.get_type())}", data)
+
+    def on_movement(self, movement):
+        """Movement observer hook for OpticalFlowController (receives MovementSample)"""
+        self.record_event("flow", {
+            "x": movement.x,
+            "y": movement.y,
+            "scale": movement.scale,
+            "yaw": movement.yaw,
+            "inlier_ratio": movement.inlier_ratio,
+            "is_takeoff": movement.is_takeoff,
+            "points": len(movement.flow_vectors) if movement.flow_vectors is not None else 0,
+            "baro_data": movement.baro_data,
+            "baro_age": movement.baro_age,
+        }, movement.timestamp)
+
+    def save_jpeg(self, frame, output_dir="captured_frames"):
+        """
+        Write a standalone JPEG on the writer thread; returns the filename it
+        will use, or None if the writer is too far behind to take it
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{output_dir}/frame_{timestamp}.jpg"
+        if not self._reserve_frame():
+            return None
+        self.queue.put_nowait(("jpeg", filename, frame))
+        return filename
+
+    def _reserve_frame(self):
+        """Count one more image waiting for the writer, unless queue_size already are"""
+        with self.lock:
+            if self.pending_frames >= self.queue_size:
+                self.frames_dropped += 1
+                return False
+            self.pending_frames += 1
+            return True
+
+    # -----------------------------
+    # Writer thread
+    # -----------------------------
+    def _writer_loop(self):
+        last_flush = time.time()
+        while True:
+            try:
+                item = self.queue.get(timeout=0.5)
+            except Empty:
+                item = ()
+            if item is None:
+                break
+
+            try:
+                if item:
+                    self._write_item(item)
+            except Exception as e:
+                print(f"Flight recorder error: {e}")
+
+            # Keep the index usable if the process dies mid-flight
+            if time.time() - last_flush > 1.0:
+                self.index_file.flush()
+                last_flush = time.time()
+
+        # Drain whatever was queued before stop()
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            try:
+                if item:
+                    self._write_item(item)
+            except Exception as e:
+                print(f"Flight recorder error: {e}")
+        self.index_file.flush()
+
+    def _write_item(self, item):
+        with self.lock:
+            if item[0] == "event":
+                self.pending_events -= 1
+            else:
+                self.pending_frames -= 1
+        if item[0] == "frame":
+            _, timestamp, seq, frame = item
+            self._write_frame(timestamp, seq, frame)
+        elif item[0] == "event":
+            _, timestamp, kind, data = item
+            self._write_index({"t": timestamp, "kind": kind, "data": data})
+            self.events_written += 1
+        elif item[0] == "jpeg":
+            _, filename, frame = item
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            cv2.imwrite(filename, frame)
+
+    def _write_frame(self, timestamp, seq, frame):
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            self.frames_dropped += 1
+            return
+
+        if self.segment_file is None or timestamp - self.segment_started >= self.segment_seconds:
+            self._roll_segment(timestamp)
+
+        offset = self.segment_file.tell()
+        data = buffer.tobytes()
+        self.segment_file.write(data)
+        self._write_index({
+            "t": timestamp,
+            "kind": "frame",
+            "seq": seq,
+            "segment": self.segment_index,
+            "offset": offset,
+            "length": len(data),
+        })
+        self.frames_written += 1
+
+    def _roll_segment(self, timestamp):
+        if self.segment_file:
+            self.segment_file.close()
+        self.segment_index += 1
+        self.segment_started = timestamp
+        self.segment_file = open(
+            os.path.join(self.path, f"video_{self.segment_index:04d}.mjpg"), "ab")
+
+    def _write_index(self, entry):
+        self.index_file.write(json.dumps(entry, default=_to_json) + "\n")
+
+
+class FlightLog:
+    """
+    Read-only view of a recorded flight with random access by timestamp.
+    Only the index is loaded up front; a frame lookup is a binary search,
+    one seek and one JPEG decode.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.frame_times = []
+        self.frames = []
+        self.event_times = []
+        self.events = []
+        self._segments = {}
+
+        with open(os.path.join(path, "index.jsonl")) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Partially written last line after a crash
+                if entry["kind"] == "frame":
+                    self.frames.append(entry)
+                else:
+                    self.events.append(entry)
+
+        self.frames.sort(key=lambda e: e["t"])
+        self.events.sort(key=lambda e: e["t"])
+        self.frame_times = [e["t"] for e in self.frames]
+        self.event_times = [e["t"] for e in self.events]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def close(self):
+        for f in self._segments.values():
+            f.close()
+        self._segments = {}
+
+    @property
+    def start_time(self):
+        times = self.frame_times[:1] + self.event_times[:1]
+        return min(times) if times else None
+
+    @property
+    def end_time(self):
+        times = self.frame_times[-1:] + self.event_times[-1:]
+        return max(times) if times else None
+
+    def frame_at(self, timestamp):
+        """Return (timestamp, frame) for the last frame at or before timestamp"""
+        i = bisect_right(self.frame_times, timestamp) - 1
+        if i < 0:
+            return None, None
+        return self.frame_times[i], self.read_frame(i)
+
+    def read_frame(self, i):
+        """Decode the i-th frame in time order"""
+        entry = self.frames[i]
+        segment = self._segments.get(entry["segment"])
+        if segment is None:
+            segment = open(os.path.join(self.path, f"video_{entry['segment']:04d}.mjpg"), "rb")
+            self._segments[entry["segment"]] = segment
+        segment.seek(entry["offset"])
+        data = segment.read(entry["length"])
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def frames_between(self, start, end):
+        """Yield (timestamp, frame) for every frame in [start, end]"""
+        lo = bisect_left(self.frame_times, start)
+        hi = bisect_right(self.frame_times, end)
+        for i in range(lo, hi):
+            yield self.frame_times[i], self.read_frame(i)
+
+    def events_between(self, start, end, kind=None):
+        """Events in [start, end], optionally filtered by kind (prefix match)"""
+        lo = bisect_left(self.event_times, start)
+        hi = bisect_right(self.event_times, end)
+        return [e for e in self.events[lo:hi]
+                if kind is None or e["kind"].startswith(kind)]
+
+    def last_event(self, timestamp, kind):
+        """Most recent event of the given kind at or before timestamp"""
+        i = bisect_right(self.event_times, timestamp) - 1
+        while i >= 0:
+            if self.events[i]["kind"].startswith(kind):
+                return self.events[i]
+            i -= 1
+        return None
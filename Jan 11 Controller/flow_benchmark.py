@@ -0,0 +1,342 @@
+#flow_benchmark.py
+"""
+Optical flow microbenchmarks, run from this directory:
+
+    python flow_benchmark.py [recording ...] [--image still.jpg] [--json results.json]
+
+Synthetic sequences with known translation, zoom and rotation (over a
+random texture, or warping --image) are scored against ground truth;
+recordings (FlightRecorder flight directories, video files or frame
+directories such as captured_frames) by jitter. --json writes every
+result, with the OpenCV/numpy versions, for comparing runs over time. See --help for selecting configurations.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+from types import SimpleNamespace
+import cv2
+import numpy as np
+from flight_recorder import FlightLog
+from frame_data import FrameData
+from frame_source import SyntheticSource, open_source
+from optical_flow import OpticalFlowController, estimate_motion, estimate_similarity
+
+
+def legacy_estimate_motion(good_old, good_new, frame_shape):
+    """The original per-point loop, kept as the baseline"""
+    height, width = frame_shape[:2]
+    center_x, center_y = width / 2, height / 2
+
+    def reject(data):
+        if not data:
+            return 0
+        q1 = np.percentile(data, 25)
+        q3 = np.percentile(data, 75)
+        iqr = q3 - q1
+        filtered = [x for x in data if q1 - 1.5 * iqr <= x <= q3 + 1.5 * iqr]
+        return np.mean(filtered) if filtered else 0
+
+    x_movements, y_movements, scale_changes, flow_vectors = [], [], [], []
+    for old_point, new_point in zip(good_old, good_new):
+        old_x, old_y = old_point.ravel()
+        new_x, new_y = new_point.ravel()
+        x_movements.append(new_x - old_x)
+        y_movements.append(new_y - old_y)
+        old_dist = np.sqrt((old_x - center_x)**2 + (old_y - center_y)**2)
+        new_dist = np.sqrt((new_x - center_x)**2 + (new_y - center_y)**2)
+        if old_dist > 0:
+            scale_changes.append((new_dist - old_dist) / old_dist)
+        flow_vectors.append((old_point.reshape(-1), (new_point - old_point).reshape(-1)))
+
+    return reject(x_movements), reject(y_movements), reject(scale_changes), flow_vectors
+
+
+def _matched_points(count, frame_shape=(720, 1280), seed=0):
+    """LK-shaped (N, 2) float32 point pairs: a shift and slight zoom plus noise and 5% outliers"""
+    rng = np.random.default_rng(seed)
+    height, width = frame_shape
+    old = rng.uniform((0, 0), (width, height), (count, 2)).astype(np.float32)
+    center = np.array([width / 2, height / 2], dtype=np.float32)
+    new = center + (old - center) * 1.01 + (3.0, -1.5) + rng.normal(0, 0.3, (count, 2))
+    outliers = rng.random(count) < 0.05
+    new[outliers] += rng.normal(0, 40, (outliers.sum(), 2))
+    return old, new.astype(np.float32)
+
+
+def _time(fn, repeat):
+    fn()  # Warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(samples))
+
+
+def bench_estimation(points=(100, 1000), repeat=200, frame_shape=(720, 1280)):
+    """Median ms per call of the legacy loop, the vectorized kernel and the RANSAC similarity fit"""
+    results = []
+    for count in points:
+        old, new = _matched_points(count, frame_shape)
+        legacy = legacy_estimate_motion(old, new, frame_shape)
+        vectorized = estimate_motion(old, new, frame_shape)
+        error = max(abs(a - b) for a, b in zip(legacy[:3], vectorized[:3]))
+
+        legacy_ms = _time(lambda: legacy_estimate_motion(old, new, frame_shape), repeat)
+        vectorized_ms = _time(lambda: estimate_motion(old, new, frame_shape), repeat)
+        similarity_ms = _time(lambda: estimate_similarity(old, new, frame_shape), repeat)
+        results.append({
+            "points": count,
+            "legacy_ms": legacy_ms,
+            "vectorized_ms": vectorized_ms,
+            "speedup": legacy_ms / vectorized_ms,
+            "similarity_ms": similarity_ms,
+            "max_abs_diff": float(error),
+        })
+    return results
+
+
+def _flow_controller(**kwargs):
+    """OpticalFlowController without a vehicle or VideoManager, for calling calculate_flow directly"""
+    return OpticalFlowController(SimpleNamespace(vehicle=None), None, **kwargs)
+
+
+def _synthetic_frames(count=60, dx=3.0, dy=-2.0, zoom=1.002, rotation=0.0, width=1280, height=720,
+                      contrast=1.0, noise=0.0, seed=0, image=None):
+    """
+    Frames of a SyntheticSource moving with constant per-frame motion over
+    a random texture (or a warped `image`), and the true per-frame
+    (x, y, scale, yaw). A low contrast with some sensor noise stands in
+    for a bare indoor floor.
+    """
+    source = SyntheticSource(width=width, height=height, realtime=False, dx=dx, dy=dy,
+                             rotation=rotation, zoom=zoom, seed=seed, image=image)
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        frame = source.read()[1].astype(np.float32)
+        if contrast != 1.0 or noise:
+            frame = 128 + (frame - 128) * contrast + rng.normal(0, noise, frame.shape)
+        frames.append(FrameData(np.clip(frame, 0, 255).astype(np.uint8)))
+    # The centre moves by zoom * R * (dx, dy); the distance of every point to it grows by zoom
+    angle = math.radians(rotation)
+    true_x = zoom * (math.cos(angle) * dx - math.sin(angle) * dy)
+    true_y = zoom * (math.sin(angle) * dx + math.cos(angle) * dy)
+    return frames, (true_x, true_y, zoom - 1.0, rotation)
+
+
+def bench_scales(scales=(1.0, 0.75, 0.5, 0.25), rois=(None, (0.25, 0.25, 0.5, 0.5)), frames=90):
+    """ms/frame of calculate_flow and its error against the synthetic ground truth, per scale and ROI"""
+    data, (true_x, true_y, true_scale, _) = _synthetic_frames(frames)
+    for frame in data:
+        frame.gray  # Shared by the capture pipeline in practice; not charged to flow
+    results = []
+    for roi in rois:
+        for scale in scales:
+            controller = _flow_controller(processing_scale=scale, roi=roi)
+            times, estimates = [], []
+            for frame in data:
+                start = time.perf_counter()
+                x, y, z, _ = controller.calculate_flow(frame)
+                times.append((time.perf_counter() - start) * 1000.0)
+                estimates.append((x, y, z))
+            estimates = np.array(estimates[1:])  # The first frame only primes the tracker
+            results.append({
+                "scale": scale,
+                "roi": roi,
+                "ms_per_frame": float(np.median(times[1:])),
+                "x_error_px": float(np.abs(estimates[:, 0] - true_x).mean()),
+                "y_error_px": float(np.abs(estimates[:, 1] - true_y).mean()),
+                "scale_error": float(np.abs(estimates[:, 2] - true_scale).mean()),
+                "detections": controller.detections,
+            })
+    return results
+
+
+def _load_recording(path, max_frames=300):
+    """
+    Up to max_frames FrameData of a recording: a FlightRecorder flight
+    directory (index.jsonl + video_*.mjpg), a video file or a directory
+    of still frames
+    """
+    frames = []
+    if os.path.isfile(os.path.join(path, "index.jsonl")):
+        log = FlightLog(path)
+        for i in range(min(len(log), max_frames)):
+            frame = log.read_frame(i)
+            if frame is not None:
+                frames.append(FrameData(frame, i, log.frame_times[i]))
+        log.close()
+    else:
+        source = open_source(path, realtime=False, loop=False)
+        while len(frames) < max_frames:
+            ret, frame = source.read()
+            if not ret:
+                break
+            frames.append(FrameData(frame.copy(), len(frames)))
+        source.release()
+    if len(frames) < 2:
+        raise ValueError(f"Recording {path} has {len(frames)} readable frames; flow needs at least 2")
+    return frames
+
+
+# Sequences with ground truth: name -> _synthetic_frames arguments
+SEQUENCES = {
+    "pan": dict(dx=3.0, dy=-2.0, zoom=1.002),
+    "rotate": dict(dx=2.0, dy=1.0, rotation=0.5),
+    "zoom": dict(dx=0.0, dy=0.0, zoom=1.01),
+    "pan+rotate+zoom": dict(dx=-2.0, dy=3.0, rotation=-0.3, zoom=0.995),
+    "low-texture": dict(dx=3.0, dy=-2.0, zoom=1.002, contrast=0.02, noise=3.0),
+}
+
+# Flow configurations: OpticalFlowController arguments, plus overrides of
+# its feature_params / lk_params
+CONFIGS = {
+    "sparse": {},
+    "sparse-similarity": dict(estimator="similarity"),
+    "sparse-200-corners": dict(feature_params=dict(maxCorners=200, qualityLevel=0.1)),
+    "sparse-50-corners": dict(feature_params=dict(maxCorners=50)),
+    "sparse-win21-level3": dict(lk_params=dict(winSize=(21, 21), maxLevel=3)),
+    "sparse-win9-level1": dict(lk_params=dict(winSize=(9, 9), maxLevel=1)),
+    "sparse-half-scale": dict(processing_scale=0.5),
+    "sparse-budget-3ms": dict(time_budget_ms=3.0),
+    "dense": dict(engine="dense"),
+    "dense-similarity": dict(engine="dense", estimator="similarity"),
+}
+
+
+def run_config(frames, config, truth=None):
+    """
+    Run calculate_flow with one configuration over a sequence: ms/frame
+    (median and 95th percentile), how often it saw no motion at all, and
+    the mean error against truth = (x, y, scale, yaw) per frame
+    """
+    if len(frames) < 2:
+        raise ValueError(f"Flow needs at least 2 frames, got {len(frames)}")
+    config = dict(config)
+    feature_params = config.pop("feature_params", {})
+    lk_params = config.pop("lk_params", {})
+    controller = _flow_controller(**config)
+    controller.feature_params.update(feature_params)
+    controller.lk_params.update(lk_params)
+
+    times, estimates, blind = [], [], 0
+    for i, frame in enumerate(frames):
+        frame.gray  # Shared by the capture pipeline in practice; not charged to flow
+        start = time.perf_counter()
+        x, y, z, flow_vectors = controller.calculate_flow(frame)
+        times.append((time.perf_counter() - start) * 1000.0)
+        if i == 0:
+            continue  # The first frame only primes the engine
+        estimates.append((x, y, z, controller.yaw))
+        if len(flow_vectors) == 0:
+            blind += 1
+    estimates = np.array(estimates)
+    result = {
+        "ms_per_frame": float(np.median(times[1:])),
+        "ms_p95": float(np.percentile(times[1:], 95)),
+        "blind_frames": blind / max(1, len(estimates)),
+    }
+    if truth is not None:
+        result["xy_error_px"] = float(np.hypot(estimates[:, 0] - truth[0], estimates[:, 1] - truth[1]).mean())
+        result["scale_error"] = float(np.abs(estimates[:, 2] - truth[2]).mean())
+        result["yaw_error_deg"] = float(np.abs(estimates[:, 3] - truth[3]).mean())
+    else:
+        # No ground truth: frame-to-frame jitter of the estimate is the best robustness signal
+        result["xy_jitter_px"] = float(np.abs(np.diff(estimates[:, :2], axis=0)).mean()) if len(estimates) > 1 else 0.0
+    return result
+
+
+def bench_suite(recordings=(), image=None, configs=None, sequences=None, frames=90):
+    """
+    Every configuration on every sequence: the synthetic ones (plus the
+    same motions warped over `image`, if given) are scored against ground
+    truth, recordings (see _load_recording) by jitter
+    """
+    configs = list(CONFIGS) if configs is None else configs
+    sequences = list(SEQUENCES) if sequences is None else sequences
+    data = []
+    for name in sequences:
+        data.append((name, *_synthetic_frames(frames, **SEQUENCES[name])))
+    if image is not None:
+        for name in sequences:
+            kwargs = SEQUENCES[name]
+            if "contrast" not in kwargs:
+                data.append((f"{name} over {image}", *_synthetic_frames(frames, image=image, **kwargs)))
+    for path in recordings:
+        data.append((path, _load_recording(path), None))
+
+    results = []
+    for sequence, frames_data, truth in data:
+        for name in configs:
+            result = {"sequence": sequence, "config": name, "params": CONFIGS[name]}
+            result.update(run_config(frames_data, CONFIGS[name], truth))
+            results.append(result)
+    return results
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Optical flow benchmarks")
+    parser.add_argument("recordings", nargs="*",
+                        help="flight directories, video files or frame directories, scored by jitter")
+    parser.add_argument("--image", help="also warp this image with each synthetic motion")
+    parser.add_argument("--config", action="append", choices=list(CONFIGS),
+                        help="flow configuration to run (repeatable; default all)")
+    parser.add_argument("--sequence", action="append", choices=list(SEQUENCES),
+                        help="synthetic sequence to run (repeatable; default all)")
+    parser.add_argument("--frames", type=int, default=90, help="frames per synthetic sequence")
+    parser.add_argument("--suite-only", action="store_true", help="skip the estimation and scale microbenchmarks")
+    parser.add_argument("--json", help="also write every result to this file, for regression tracking")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args(sys.argv[1:])
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "frames": args.frames,
+    }
+
+    if not args.suite_only:
+        print("Motion estimation (deltas, scale change, IQR filtering, means):")
+        report["estimation"] = bench_estimation()
+        for r in report["estimation"]:
+            print(f"  {r['points']:5d} points: legacy {r['legacy_ms']:.3f}ms, "
+                  f"vectorized {r['vectorized_ms']:.3f}ms ({r['speedup']:.1f}x), "
+                  f"max difference {r['max_abs_diff']:.2e}; similarity fit {r['similarity_ms']:.3f}ms")
+
+        print("Flow per frame by processing scale and ROI (synthetic pan, 1280x720):")
+        report["scales"] = bench_scales(frames=args.frames)
+        for r in report["scales"]:
+            roi = "full frame" if r["roi"] is None else f"roi {r['roi']}"
+            print(f"  scale {r['scale']:.2f}, {roi}: {r['ms_per_frame']:.2f}ms, "
+                  f"error x {r['x_error_px']:.3f}px y {r['y_error_px']:.3f}px scale {r['scale_error']:.5f}, "
+                  f"{r['detections']} corner detections")
+
+    print("Flow configurations (median / p95 ms per frame, share of frames without any flow):")
+    try:
+        report["suite"] = bench_suite(args.recordings, args.image, args.config, args.sequence, args.frames)
+    except ValueError as e:
+        sys.exit(f"flow_benchmark: {e}")
+    sequence = None
+    for r in report["suite"]:
+        if r["sequence"] != sequence:
+            sequence = r["sequence"]
+            print(f"  {sequence}:")
+        quality = (f"error {r['xy_error_px']:.3f}px scale {r['scale_error']:.5f} yaw {r['yaw_error_deg']:.3f}deg"
+                   if "xy_error_px" in r else f"jitter {r['xy_jitter_px']:.3f}px")
+        print(f"    {r['config']:20s} {r['ms_per_frame']:6.2f} / {r['ms_p95']:6.2f}ms, "
+              f"blind {r['blind_frames']:4.0%}, {quality}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
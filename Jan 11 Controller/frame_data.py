@@ -0,0 +1,63 @@
+#frame_data.py
+import cv2
+import time
+from threading import Lock
+
+
+class FrameData:
+    """
+    A captured frame together with the data consumers derive from it:
+    grayscale and downscaled copies. Each is computed lazily on first use
+    and at most once per frame, however many stages and subscribers ask
+    for it, so optical flow, the box tracker and the detector share one
+    cvtColor / resize.
+
+    Derived arrays are shared between consumers like the frame itself and
+    must not be modified.
+    """
+    def __init__(self, frame, index=0, timestamp=None):
+        self.frame = frame
+        self.index = index
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.lock = Lock()
+        self._gray = None
+        self._downscales = {}  # max_side -> (image, scale)
+
+    @property
+    def shape(self):
+        return self.frame.shape
+
+    @property
+    def gray(self):
+        """Single-channel version of the frame"""
+        if self._gray is None:
+            with self.lock:
+                if self._gray is None:
+                    frame = self.frame
+                    if frame.ndim == 3:
+                        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                        frame.flags.writeable = False
+                    self._gray = frame
+        return self._gray
+
+    def downscale(self, max_side):
+        """
+        (image, scale) with the frame shrunk so its longer side is at most
+        max_side; scale is the factor applied (1.0 if it already fits)
+        """
+        downscale = self._downscales.get(max_side)
+        if downscale is None:
+            with self.lock:
+                downscale = self._downscales.get(max_side)
+                if downscale is None:
+                    height, width = self.frame.shape[:2]
+                    scale = min(1.0, max_side / max(height, width))
+                    if scale < 1.0:
+                        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                        image = cv2.resize(self.frame, size, interpolation=cv2.INTER_AREA)
+                        image.flags.writeable = False
+                    else:
+                        image = self.frame
+                    downscale = (image, scale)
+                    self._downscales[max_side] = downscale
+        return downscale
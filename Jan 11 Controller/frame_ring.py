@@ -0,0 +1,82 @@
+#frame_ring.py
+import numpy as np
+import sys
+from threading import Lock
+
+class FrameRing:
+    """
+    Preallocated pool of frame buffers for the capture pipeline.
+
+    The camera decodes straight into a free slot, which is then published as
+    a read-only view. get_frame(), subscribers, the display and the recorder
+    all share that one view instead of taking copies.
+
+    Reference counting is Python's own: every view (and every slice of a view)
+    keeps a reference to its slot, so a slot is handed out again only once
+    nothing refers to it any more. If consumers hold on to every slot the
+    ring grows up to max_slots, after which capture falls back to freshly
+    allocated frames (counted in misses).
+    """
+    def __init__(self, slots=8, max_slots=16):
+        self.initial_slots = slots
+        self.max_slots = max(slots, max_slots)
+        self.slots = []
+        self.shape = None
+        self.dtype = None
+        self.next_slot = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def resize(self, shape, dtype):
+        """(Re)allocate the slots for a new frame shape; outstanding views stay valid"""
+        with self.lock:
+            self.shape = shape
+            self.dtype = dtype
+            self.slots = [np.empty(shape, dtype) for _ in range(self.initial_slots)]
+            self.next_slot = 0
+
+    def set_max_slots(self, max_slots):
+        """Change how far the ring may grow; free slots beyond a lower limit are released"""
+        with self.lock:
+            self.max_slots = max(self.initial_slots, max_slots)
+            if len(self.slots) > self.max_slots:
+                del self.slots[self.max_slots:]
+                self.next_slot %= len(self.slots)
+
+    def matches(self, frame):
+        """True if frame has the shape and dtype the slots were allocated for"""
+        return frame.shape == self.shape and frame.dtype == self.dtype
+
+    def acquire(self):
+        """Return a writable slot nobody else references, or None if there is none"""
+        with self.lock:
+            count = len(self.slots)
+            if count == 0:
+                return None
+
+            for i in range(count):
+                index = (self.next_slot + i) % count
+                # Only the slot list and getrefcount's own argument refer to a free slot
+                if sys.getrefcount(self.slots[index]) <= 2:
+                    self.next_slot = (index + 1) % count
+                    return self.slots[index]
+
+            if count < self.max_slots:
+                slot = np.empty(self.shape, self.dtype)
+                self.slots.append(slot)
+                return slot
+
+            self.misses += 1
+            return None
+
+    def in_use(self):
+        """Number of slots currently referenced by a consumer"""
+        with self.lock:
+            return sum(1 for i in range(len(self.slots)) if sys.getrefcount(self.slots[i]) > 2)
+
+    @staticmethod
+    def publish(frame):
+        """Read-only view of a filled buffer, safe to share between consumers"""
+        view = frame.view()
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,296 @@
+#frame_source.py
+import cv2
+import numpy as np
+import glob
+import math
+import os
+import time
+
+
+class FrameSource:
+    """
+    Something VideoManager can capture from. Sources mimic the subset of
+    cv2.VideoCapture the capture loop uses (isOpened, read(buffer), set,
+    get, release), so a live camera and a recording are interchangeable.
+
+    With realtime=True, read() is paced to the source's fps as a camera
+    would be; with realtime=False frames come as fast as they can be
+    produced, for throughput measurements. `finished` turns True when a
+    non-looping file or sequence runs out.
+    """
+    def __init__(self, fps=30.0, realtime=True):
+        self.fps = fps
+        self.realtime = realtime
+        self.finished = False
+        self.frames_read = 0
+        self.next_frame_time = None
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def release(self):
+        pass
+
+    def read(self, buffer=None):
+        self._pace()
+        frame = self._next_frame(buffer)
+        if frame is None:
+            return False, None
+        self.frames_read += 1
+        return True, frame
+
+    def _next_frame(self, buffer):
+        raise NotImplementedError
+
+    def _pace(self):
+        if not self.realtime or not self.fps:
+            return
+        now = time.time()
+        if self.next_frame_time is None or now - self.next_frame_time > 1.0:
+            self.next_frame_time = now  # First frame, or we fell far behind: don't burst
+        elif self.next_frame_time > now:
+            time.sleep(self.next_frame_time - now)
+        self.next_frame_time += 1.0 / self.fps
+
+    @staticmethod
+    def _into(buffer, frame):
+        """Copy frame into the caller's buffer when it fits, like VideoCapture.read(image)"""
+        if buffer is not None and buffer.shape == frame.shape and buffer.dtype == frame.dtype:
+            np.copyto(buffer, frame)
+            return buffer
+        return frame
+
+
+class DeviceSource(FrameSource):
+    """A live capture device (the Skydroid receiver, a webcam, ...), paced by the device itself"""
+    def __init__(self, device_id, width=1280, height=720):
+        super().__init__(fps=None, realtime=False)
+        self.device_id = device_id
+        self.camera = cv2.VideoCapture(device_id)
+        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.fps = self.camera.get(cv2.CAP_PROP_FPS)
+
+    def isOpened(self):
+        return self.camera.isOpened()
+
+    def set(self, prop, value):
+        return self.camera.set(prop, value)
+
+    def get(self, prop):
+        return self.camera.get(prop)
+
+    def release(self):
+        self.camera.release()
+
+    def read(self, buffer=None):
+        if buffer is not None:
+            ret, frame = self.camera.read(buffer)
+        else:
+            ret, frame = self.camera.read()
+        if ret:
+            self.frames_read += 1
+        return ret, frame
+
+
+class VideoFileSource(FrameSource):
+    """A recorded video file, played at its own frame rate (or flat out)"""
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.loop = loop
+        self.camera = cv2.VideoCapture(path)
+        super().__init__(fps=self.camera.get(cv2.CAP_PROP_FPS) or 30.0, realtime=realtime)
+
+    def isOpened(self):
+        return self.camera.isOpened()
+
+    def get(self, prop):
+        return self.camera.get(prop)
+
+    def release(self):
+        self.camera.release()
+
+    def _next_frame(self, buffer):
+        ret, frame = self.camera.read(buffer) if buffer is not None else self.camera.read()
+        if not ret and self.loop and self.frames_read:
+            self.camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.camera.read(buffer) if buffer is not None else self.camera.read()
+        if not ret:
+            self.finished = True
+            return None
+        return frame
+
+
+class ImageSequenceSource(FrameSource):
+    """A directory of still frames, e.g. captured_frames/, in file name order"""
+    def __init__(self, directory, pattern="*.jpg", fps=30.0, realtime=True, loop=True):
+        super().__init__(fps=fps, realtime=realtime)
+        self.directory = directory
+        self.files = sorted(glob.glob(os.path.join(directory, pattern)))
+        self.loop = loop
+        self.position = 0
+
+    def isOpened(self):
+        return bool(self.files)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.files))
+        return super().get(prop)
+
+    def _next_frame(self, buffer):
+        for _ in range(len(self.files)):
+            if self.position >= len(self.files):
+                if not self.loop:
+                    break
+                self.position = 0
+            path = self.files[self.position]
+            self.position += 1
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is not None:
+                return self._into(buffer, frame)
+            print(f"Skipping unreadable frame {path}")
+        self.finished = True
+        return None
+
+
+class SyntheticSource(FrameSource):
+    """
+    A camera gliding over an endless random texture with known motion, for
+    exercising optical flow and tracking with ground truth.
+
+    Every frame, a point p of the previous frame (relative to the image
+    centre) moves to zoom * R(rotation) * (p + (dx, dy)): the content
+    shifts by (dx, dy) pixels, then rotates by `rotation` degrees and
+    scales by `zoom` about the centre - what a flow estimator should
+    report. After each read, `last_motion` holds that frame's motion and
+    `pose` the accumulated (x, y, angle, scale).
+
+    `image` (a path or BGR array, e.g. a still of real ground) replaces
+    the random texture; it is mirrored into a seamless tile.
+    """
+    def __init__(self, width=1280, height=720, fps=30.0, realtime=True,
+                 dx=2.0, dy=0.0, rotation=0.0, zoom=1.0, texture_size=1024,
+                 feature_scale=8.0, noise=0.0, seed=0, image=None):
+        super().__init__(fps=fps, realtime=realtime)
+        self.width = width
+        self.height = height
+        self.motion = (dx, dy, rotation, zoom)
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+        # The view must fit in the 3x3 tiling around the centre tile
+        self.texture_size = max(texture_size, int(math.hypot(width, height) / 2) + 1)
+        if image is not None:
+            self.texture_size += self.texture_size % 2
+            texture = self._mirror_texture(image, self.texture_size)
+        else:
+            texture = self._make_texture(self.texture_size, feature_scale)
+        self.texture = np.tile(texture, (3, 3, 1))
+
+        # Camera pose in texture coordinates
+        self.center = np.array([self.texture_size / 2.0, self.texture_size / 2.0])
+        self.angle = 0.0
+        self.scale = 1.0
+        self.pose = (0.0, 0.0, 0.0, 1.0)
+        self.last_motion = None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return super().get(prop)
+
+    def set_motion(self, dx=0.0, dy=0.0, rotation=0.0, zoom=1.0):
+        """Change the per-frame motion from the next frame on"""
+        self.motion = (dx, dy, rotation, zoom)
+
+    def _make_texture(self, size, feature_scale):
+        # Band-limited noise built in the frequency domain tiles seamlessly
+        fy = np.fft.fftfreq(size)[:, None]
+        fx = np.fft.rfftfreq(size)[None, :]
+        falloff = np.exp(-(fx ** 2 + fy ** 2) * (feature_scale * math.pi) ** 2)
+        channels = []
+        for _ in range(3):
+            spectrum = np.fft.rfft2(self.rng.standard_normal((size, size))) * falloff
+            channel = np.fft.irfft2(spectrum, s=(size, size))
+            channel = (channel - channel.mean()) / (channel.std() + 1e-9)
+            channels.append(np.clip(128 + 48 * channel, 0, 255))
+        return np.dstack(channels).astype(np.uint8)
+
+    @staticmethod
+    def _mirror_texture(image, size):
+        # The image next to its reflections repeats without seams
+        if isinstance(image, str):
+            path = image
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError(f"Could not read texture image {path}")
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        half = size // 2
+        image = cv2.resize(image, (half, half), interpolation=cv2.INTER_AREA)
+        top = np.hstack([image, image[:, ::-1]])
+        return np.vstack([top, top[::-1]])
+
+    def _next_frame(self, buffer):
+        if self.frames_read > 0:
+            self._advance()
+
+        cos = math.cos(self.angle) / self.scale
+        sin = math.sin(self.angle) / self.scale
+        size = self.texture_size
+        cx, cy = size + self.center % size  # Centre tile of the 3x3 tiling
+        half_w, half_h = self.width / 2.0, self.height / 2.0
+        # Output pixel -> texture point
+        matrix = np.array([
+            [cos, -sin, cx - cos * half_w + sin * half_h],
+            [sin, cos, cy - sin * half_w - cos * half_h],
+        ])
+        out = buffer if buffer is not None and buffer.shape == (self.height, self.width, 3) else None
+        frame = cv2.warpAffine(self.texture, matrix, (self.width, self.height), dst=out,
+                               flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+        if self.noise:
+            noise = self.rng.normal(0, self.noise, frame.shape)
+            np.copyto(frame, np.clip(frame + noise, 0, 255).astype(np.uint8))
+        return frame
+
+    def _advance(self):
+        dx, dy, rotation, zoom = self.motion
+        # Content moving by (dx, dy) in the image = camera moving the other way over the texture
+        cos, sin = math.cos(self.angle), math.sin(self.angle)
+        self.center -= np.array([cos * dx - sin * dy, sin * dx + cos * dy]) / self.scale
+        self.angle -= math.radians(rotation)
+        self.scale *= zoom
+        x, y, angle, scale = self.pose
+        self.pose = (x + dx, y + dy, angle + rotation, scale * zoom)
+        self.last_motion = {"dx": dx, "dy": dy, "rotation": rotation, "zoom": zoom}
+
+
+def open_source(spec, realtime=True, loop=True):
+    """
+    FrameSource for a VideoManager source spec:
+        int, or "/dev/videoN"        live device
+        "synthetic"                  SyntheticSource with default motion
+        directory                    ImageSequenceSource of its *.jpg files
+        other path                   VideoFileSource
+        FrameSource                  used as is
+    """
+    if isinstance(spec, FrameSource):
+        return spec
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.startswith("/dev/video")):
+        return DeviceSource(spec)
+    if spec == "synthetic":
+        return SyntheticSource(realtime=realtime)
+    if os.path.isdir(spec):
+        return ImageSequenceSource(spec, realtime=realtime, loop=loop)
+    return VideoFileSource(spec, realtime=realtime, loop=loop)
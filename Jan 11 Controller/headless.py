@@ -0,0 +1,201 @@
+#headless.py
+import cv2
+import time
+from threading import Thread, Condition, Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+
+
+class MjpegPreview:
+    """
+    Local HTTP server streaming the annotated video as MJPEG, for running
+    the VideoManager without a GUI:
+
+        http://host:port/                 page showing every source
+        http://host:port/stream           primary source
+        http://host:port/stream/<source>  one named source
+
+    Frames are downscaled to max_width and encoded at most max_fps times a
+    second per source, and only while at least one viewer is connected to
+    that source; with nobody watching the preview costs nothing.
+    """
+    def __init__(self, host="127.0.0.1", port=8080, max_fps=10, max_width=640, jpeg_quality=70):
+        self.host = host
+        self.port = port
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+
+        self.sources = []
+        self.viewers = {}      # source -> connected clients
+        self.jpegs = {}        # source -> (sequence number, JPEG bytes)
+        self.last_encode = {}
+        self.condition = Condition()
+        self.running = False
+        self.server = None
+        self.thread = None
+
+        # Stats
+        self.frames_encoded = 0
+
+    def start(self, sources):
+        """Start serving the given source names (the first one is the default stream)"""
+        self.sources = list(sources)
+        self.server = ThreadingHTTPServer((self.host, self.port), _preview_handler(self))
+        self.running = True
+        self.thread = Thread(target=self.server.serve_forever, name="mjpeg-preview", daemon=True)
+        self.thread.start()
+        print(f"MJPEG preview on http://{self.host}:{self.port}/")
+        return self
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread = None
+        print(f"MJPEG preview stopped ({self.frames_encoded} frames encoded)")
+
+    def wants(self, source):
+        """True if a viewer is waiting on source and its next preview frame is due"""
+        if not self.viewers.get(source):
+            return False
+        return time.time() - self.last_encode.get(source, 0.0) >= self.min_interval
+
+    def publish(self, source, frame):
+        """Encode an annotated frame for the viewers of source"""
+        self.last_encode[source] = time.time()
+        height, width = frame.shape[:2]
+        if self.max_width and width > self.max_width:
+            size = (self.max_width, int(height * self.max_width / width))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return
+        with self.condition:
+            seq = self.jpegs.get(source, (0, None))[0] + 1
+            self.jpegs[source] = (seq, buffer.tobytes())
+            self.condition.notify_all()
+        self.frames_encoded += 1
+
+    def _serve_stream(self, handler, source):
+        handler.send_response(200)
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        handler.end_headers()
+
+        with self.condition:
+            self.viewers[source] = self.viewers.get(source, 0) + 1
+        last_seq = 0
+        try:
+            while self.running:
+                with self.condition:
+                    self.condition.wait_for(
+                        lambda: not self.running or self.jpegs.get(source, (0, None))[0] != last_seq,
+                        timeout=1.0)
+                    seq, jpeg = self.jpegs.get(source, (0, None))
+                if jpeg is None or seq == last_seq:
+                    continue
+                last_seq = seq
+                handler.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                    + f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+                                    + jpeg + b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Viewer went away
+        finally:
+            with self.condition:
+                self.viewers[source] -= 1
+
+    def _index_page(self):
+        images = "".join(
+            f'<div><h3>{name}</h3><img src="/stream/{name}"></div>' for name in self.sources)
+        return f"<html><head><title>Drone Video Feed</title></head><body>{images}</body></html>"
+
+
+def _preview_handler(preview):
+    class PreviewHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if path == "":
+                body = preview._index_page().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif path == "/stream" and preview.sources:
+                preview._serve_stream(self, preview.sources[0])
+            elif path.startswith("/stream/") and path[len("/stream/"):] in preview.sources:
+                preview._serve_stream(self, path[len("/stream/"):])
+            else:
+                self.send_error(404)
+
+        def log_message(self, format, *args):
+            pass  # One line per request would flood the console
+
+    return PreviewHandler
+
+
+class ControlSocket:
+    """
+    Line-based local control socket, the headless stand-in for the video
+    window's keyboard. Each line received is passed to handler(line) and
+    the returned string is sent back, e.g.
+
+        $ nc 127.0.0.1 8081
+        viz all
+        ok
+    """
+    def __init__(self, handler, host="127.0.0.1", port=8081):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.lock = Lock()  # One command at a time
+
+    def start(self):
+        self.server = _ControlServer((self.host, self.port), _control_handler(self))
+        self.thread = Thread(target=self.server.serve_forever, name="control-socket", daemon=True)
+        self.thread.start()
+        print(f"Control socket on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        self.thread = None
+
+    def execute(self, line):
+        with self.lock:
+            try:
+                return self.handler(line)
+            except Exception as e:
+                return f"error: {e}"
+
+
+class _ControlServer(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def _control_handler(control):
+    class ControlHandler(StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                line = raw.decode("utf-8", "replace").strip()
+                if not line:
+                    continue
+                reply = control.execute(line)
+                try:
+                    self.wfile.write((str(reply) + "\n").encode("utf-8"))
+                except (BrokenPipeError, ConnectionResetError):
+                    break
+
+    return ControlHandler
@@ -0,0 +1,126 @@
+#movement.py
+import numpy as np
+
+
+class MovementSample:
+    """
+    One optical flow result, as delivered to movement observers. Fields
+    are attributes; sample['x'] and sample.get('baro_data') also work, so
+    observers written against the old movement_data dict keep running.
+    """
+    __slots__ = ('x', 'y', 'scale', 'yaw', 'inlier_ratio', 'timestamp', 'is_takeoff',
+                 'flow_vectors', 'track_ages', 'baro_data', 'baro_age', 'history')
+
+    def __init__(self, x, y, scale, timestamp, is_takeoff=False, flow_vectors=None, track_ages=None,
+                 yaw=0.0, inlier_ratio=None, baro_data=None, baro_age=None, history=None):
+        self.x = x
+        self.y = y
+        self.scale = scale
+        self.yaw = yaw
+        self.inlier_ratio = inlier_ratio
+        self.timestamp = timestamp
+        self.is_takeoff = is_takeoff
+        self.flow_vectors = flow_vectors
+        self.track_ages = track_ages
+        self.baro_data = baro_data
+        self.baro_age = baro_age
+        self.history = history  # MovementHistory this sample was appended to
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return (f"MovementSample(x={self.x:.2f}, y={self.y:.2f}, scale={self.scale:.4f}, "
+                f"yaw={self.yaw:.2f}, t={self.timestamp:.3f})")
+
+
+SAMPLE_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('x', 'f4'),
+    ('y', 'f4'),
+    ('scale', 'f4'),
+    ('yaw', 'f4'),
+    ('inlier_ratio', 'f4'),   # NaN when the estimator doesn't measure it
+    ('points', 'i4'),
+    ('baro_altitude', 'f4'),  # NaN without a barometer reading
+    ('baro_age', 'f4'),
+    ('is_takeoff', '?'),
+])
+
+
+class MovementHistory:
+    """
+    Fixed-capacity ring buffer of recent movement samples in one
+    structured numpy array (SAMPLE_DTYPE), preallocated once.
+
+    Every sample is written twice, capacity rows apart, so the newest n
+    samples are always one contiguous slice: window(n), values(field, n)
+    and the statistics below are O(1) views with no copying. Views stay
+    valid until the next append; copy() anything kept longer.
+    """
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.buffer = np.zeros(2 * capacity, dtype=SAMPLE_DTYPE)
+        self.next = 0   # Row of the next write in the first half
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.next = 0
+        self.count = 0
+
+    def append(self, sample):
+        row = (
+            sample.timestamp,
+            sample.x,
+            sample.y,
+            sample.scale,
+            sample.yaw,
+            np.nan if sample.inlier_ratio is None else sample.inlier_ratio,
+            0 if sample.flow_vectors is None else len(sample.flow_vectors),
+            sample.baro_data['altitude'] if sample.baro_data else np.nan,
+            np.nan if sample.baro_age is None else sample.baro_age,
+            sample.is_takeoff,
+        )
+        self.buffer[self.next] = row
+        self.buffer[self.next + self.capacity] = row
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def window(self, n=None):
+        """The newest n samples (all by default), oldest first, as a view"""
+        n = self.count if n is None else min(n, self.count)
+        end = self.next + self.capacity
+        return self.buffer[end - n:end]
+
+    def values(self, field, n=None):
+        """One field of the newest n samples, oldest first, as a view"""
+        return self.window(n)[field]
+
+    def mean(self, field, n=None):
+        """Mean of field over the newest n samples, ignoring NaNs (0.0 if there are none)"""
+        values = self.values(field, n)
+        valid = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+        return float(valid.mean()) if len(valid) else 0.0
+
+    def rate(self, field, n=None):
+        """Change of field per second across the newest n samples"""
+        window = self.window(n)
+        if len(window) < 2:
+            return 0.0
+        elapsed = window['timestamp'][-1] - window['timestamp'][0]
+        if elapsed <= 0:
+            return 0.0
+        return float((window[field][-1] - window[field][0]) / elapsed)
+
+    def total(self, field, n=None):
+        """Sum of field over the newest n samples, e.g. pixels moved"""
+        return float(np.sum(self.values(field, n)))
@@ -3,18 +3,122 @@ import cv2
 import numpy as np
 import time
 from video import VideoManager, VisualizationType
+from frame_data import FrameData
+from movement import MovementSample, MovementHistory
+
+NO_FLOW_VECTORS = np.empty((0, 2, 2), dtype=np.float32)
+
+def reject_outliers(data):
+    """
+    Mean of data after IQR outlier rejection. For an (N, K) array each
+    column is filtered and averaged independently; returns 0 for no data.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.shape[0] == 0:
+        return np.zeros(data.shape[1:]) if data.ndim > 1 else 0.0
+
+    q1, q3 = np.percentile(data, [25, 75], axis=0)
+    iqr = q3 - q1
+    inside = (data >= q1 - 1.5 * iqr) & (data <= q3 + 1.5 * iqr)
+    counts = inside.sum(axis=0)
+    means = np.where(inside, data, 0.0).sum(axis=0) / np.maximum(counts, 1)
+    return np.where(counts > 0, means, 0.0)
+
+def estimate_motion(good_old, good_new, frame_shape):
+    """
+    Lateral movement and radial scale change between matched points, as
+    whole-array operations on the (N, 2) point sets. Returns
+    (x, y, scale, flow_vectors) with flow_vectors an (N, 2, 2) array of
+    [point, displacement] rows.
+    """
+    height, width = frame_shape[:2]
+    center = np.array([width / 2, height / 2], dtype=np.float32)
+    old = good_old.reshape(-1, 2)
+    new = good_new.reshape(-1, 2)
+    delta = new - old
+
+    # Lateral movement, x and y filtered independently
+    x_movement, y_movement = reject_outliers(delta)
+
+    # Scale change (altitude / forward motion): relative change of each point's distance to the centre
+    old_dist = np.linalg.norm(old - center, axis=1)
+    new_dist = np.linalg.norm(new - center, axis=1)
+    valid = old_dist > 0
+    scale_changes = (new_dist[valid] - old_dist[valid]) / old_dist[valid]
+    scale_change = float(reject_outliers(scale_changes))
+
+    flow_vectors = np.stack([old, delta], axis=1)
+    return float(x_movement), float(y_movement), scale_change, flow_vectors
+
+def estimate_similarity(good_old, good_new, frame_shape, ransac_threshold=1.0):
+    """
+    Fit one similarity transform (translation, rotation, uniform scale)
+    to the matched points with RANSAC. Returns
+    (x, y, scale, flow_vectors, yaw, inlier_ratio): x, y is the
+    displacement of the image centre, scale the relative scale change
+    (as estimate_motion), yaw the rotation in degrees and inlier_ratio the
+    fraction of points consistent with the fit.
+    """
+    old = good_old.reshape(-1, 2)
+    new = good_new.reshape(-1, 2)
+    flow_vectors = np.stack([old, new - old], axis=1)
+    if len(old) < 2:
+        return 0.0, 0.0, 0.0, flow_vectors, 0.0, 0.0
+
+    matrix, inliers = cv2.estimateAffinePartial2D(
+        old, new, method=cv2.RANSAC, ransacReprojThreshold=ransac_threshold)
+    if matrix is None:
+        return 0.0, 0.0, 0.0, flow_vectors, 0.0, 0.0
+
+    height, width = frame_shape[:2]
+    center = np.array([width / 2, height / 2])
+    x_movement, y_movement = matrix[:, :2] @ center + matrix[:, 2] - center
+    scale = np.hypot(matrix[0, 0], matrix[1, 0])
+    yaw = np.degrees(np.arctan2(matrix[1, 0], matrix[0, 0]))
+    inlier_ratio = float(inliers.mean())
+    return float(x_movement), float(y_movement), float(scale - 1.0), flow_vectors, float(yaw), inlier_ratio
 
 class OpticalFlowController:
-    def __init__(self, controller, video_manager):
+    """
+    Sparse optical flow for position hold. Flow can be computed on a
+    downscaled image (processing_scale) and/or only inside a region of
+    interest (roi); movements, tracks and flow vectors are always reported
+    in full-frame pixels, so the controller gains don't depend on either.
+
+    engine picks how motion is measured, and can be switched at runtime
+    with set_engine():
+        "sparse"  persistent KLT tracks on corners (goodFeaturesToTrack +
+                  pyramidal LK), at processing_scale
+        "dense"   DIS dense flow on a heavily downscaled frame
+                  (dense_scale), sampled on a grid; keeps working on
+                  low-texture floors where too few corners are found
+    Both produce the same movement data.
+
+    estimator picks how the tracked points become one motion estimate:
+        "iqr"         per-axis IQR-filtered means and radial scale change
+                      (estimate_motion)
+        "similarity"  one RANSAC similarity fit (estimate_similarity),
+                      which also measures yaw and an inlier ratio
+
+    With a time budget (time_budget_ms, or set_time_budget()), the sparse
+    engine adapts its corner count, LK window and pyramid levels within
+    budget_bounds so that calculate_flow keeps to the budget.
+    """
+    ENGINES = ("sparse", "dense")
+    ESTIMATORS = ("iqr", "similarity")
+
+    def __init__(self, controller, video_manager, source=None, processing_scale=1.0, roi=None,
+                 estimator="iqr", engine="sparse", time_budget_ms=None):
         self.controller = controller
         self.vehicle = controller.vehicle
         self.video_manager = video_manager
-        self.prev_frame = None
+        self.source = source  # VideoManager source to track; None = its primary camera
         self.running = False
         self.is_takeoff = False
         
-        # Movement observers
+        # Movement observers, and the recent samples they can look back on
         self.movement_observers = []
+        self.history = MovementHistory(capacity=256)
         
         # Control parameters
         self.dead_zone = 5.0  # Pixels of movement to ignore
@@ -35,6 +139,231 @@ class OpticalFlowController:
             criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
         )
 
+        # Persistent KLT tracks: corners are only detected again, in the
+        # empty parts of the image, when fewer than min_tracks survive
+        self.min_tracks = 50
+        self.fb_threshold = 1.0  # Max forward-backward error in processing pixels
+
+        # Motion estimator; yaw and inlier_ratio are only measured by "similarity"
+        if estimator not in self.ESTIMATORS:
+            raise ValueError(f"Unknown estimator '{estimator}', expected one of {self.ESTIMATORS}")
+        self.estimator = estimator
+        self.ransac_threshold = 1.0  # Full-frame pixels
+        self.yaw = 0.0            # Degrees of rotation in the last frame
+        self.inlier_ratio = None  # Fraction of tracks agreeing with the last fit
+
+        # Dense engine: DIS at dense_scale of the frame, sampled every dense_step processing pixels
+        self.dense_scale = 0.125
+        self.dense_step = 4
+        self.dis = None
+
+        # Adaptive time budget for the sparse engine: every budget_interval
+        # frames the smoothed calculate_flow time is compared to the budget
+        # and one parameter is stepped down (or, with headroom, back up)
+        self.time_budget_ms = None
+        self.budget_bounds = dict(maxCorners=(30, 300), winSize=(9, 31), maxLevel=(1, 4))
+        self.budget_headroom = 0.7   # Only spend more once below this fraction of the budget
+        self.budget_interval = 15    # Frames between adjustments, so each one can take effect
+        self.budget_smoothing = 0.2  # EMA weight of the newest frame time
+        self.flow_ms = None          # Smoothed calculate_flow time
+        self.frames_since_adjustment = 0
+        # (maxCorners, winSize, maxLevel) chosen by the budget, applied before the next frame is tracked
+        self.pending_budget_params = None
+
+        self.engine = "sparse"
+        self.processing_scale = processing_scale
+        self.roi = roi
+        self.set_engine(engine)
+        self.set_time_budget(time_budget_ms)
+
+    def set_engine(self, engine):
+        """Switch between the "sparse" and "dense" flow engines; restarts tracking"""
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown flow engine '{engine}', expected one of {self.ENGINES}")
+        if engine == "dense" and self.dis is None:
+            self.dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST)
+            # Ultrafast stops two pyramid levels above the input; at 1/8 scale that is too coarse
+            self.dis.setFinestScale(1)
+        self.engine = engine
+        self.set_processing(self.processing_scale, self.roi)
+
+    def set_processing(self, scale=1.0, roi=None):
+        """
+        Compute flow at `scale` times the frame resolution, inside roi:
+        either (x, y, w, h) as fractions of the frame, e.g. the central
+        quarter (0.25, 0.25, 0.5, 0.5), or a uint8 mask of the frame's size
+        (non-zero = use). None means the whole frame. Restarts tracking.
+        """
+        if not 0 < scale <= 1:
+            raise ValueError(f"processing scale must be in (0, 1], got {scale}")
+        self.processing_scale = scale
+        self.roi = roi
+        self.geometry = None  # (frame shape, crop, size, (sx, sy), feature mask), cached per frame size
+        self._reset_tracks()
+
+    def set_time_budget(self, budget_ms, bounds=None):
+        """
+        Keep sparse flow within budget_ms per frame by adapting maxCorners,
+        winSize and maxLevel, each within bounds (name -> (min, max),
+        defaults in budget_bounds). None turns adaptation off and leaves
+        the parameters as they are.
+        """
+        if budget_ms is not None and budget_ms <= 0:
+            raise ValueError(f"time budget must be positive, got {budget_ms}")
+        if bounds:
+            self.budget_bounds = dict(self.budget_bounds, **bounds)
+        self.time_budget_ms = budget_ms
+        self.flow_ms = None
+        self.frames_since_adjustment = 0
+        if budget_ms is not None:
+            # Start inside the bounds
+            corners, window, levels = self._budget_params()
+            corners, window, levels = self.pending_budget_params = (
+                self._clamp('maxCorners', corners), self._clamp('winSize', window), self._clamp('maxLevel', levels))
+            print(f"Flow budget {budget_ms:.1f}ms: starting at maxCorners {corners}, "
+                  f"winSize {window}, maxLevel {levels}")
+
+    def _clamp(self, name, value):
+        low, high = self.budget_bounds[name]
+        return min(max(value, low), high)
+
+    def _budget_params(self):
+        return self.feature_params['maxCorners'], self.lk_params['winSize'][0], self.lk_params['maxLevel']
+
+    def _apply_budget_params(self, corners, window, levels):
+        self.feature_params['maxCorners'] = corners
+        self.lk_params['winSize'] = (window, window)
+        self.lk_params['maxLevel'] = levels
+        # Re-detect at half the corner budget, as with the default 50 of 100
+        self.min_tracks = max(1, corners // 2)
+        if len(self.points) > corners:
+            # Drop the youngest tracks; the old ones have proven themselves
+            keep = np.sort(np.argsort(-self.track_ages, kind='stable')[:corners])
+            self.points = self.points[keep]
+            self.track_ids = self.track_ids[keep]
+            self.track_ages = self.track_ages[keep]
+
+    def _adapt_to_budget(self, frame_ms):
+        """Fold frame_ms into the smoothed flow time and step one parameter towards the budget"""
+        if self.flow_ms is None:
+            self.flow_ms = frame_ms
+        else:
+            self.flow_ms += self.budget_smoothing * (frame_ms - self.flow_ms)
+        self.frames_since_adjustment += 1
+        if self.frames_since_adjustment < self.budget_interval:
+            return
+
+        corners, window, levels = current = self.pending_budget_params or self._budget_params()
+        (min_corners, max_corners), (min_window, max_window), (min_levels, max_levels) = (
+            self.budget_bounds['maxCorners'], self.budget_bounds['winSize'], self.budget_bounds['maxLevel'])
+        if self.flow_ms > self.time_budget_ms:
+            # Give up what costs the most accuracy last: fewer corners first, then a smaller window, then fewer levels
+            if corners > min_corners:
+                corners = max(min_corners, int(corners * 0.8))
+            elif window > min_window:
+                window = max(min_window, window - 2)
+            elif levels > min_levels:
+                levels -= 1
+        elif self.flow_ms < self.time_budget_ms * self.budget_headroom:
+            # Restore in reverse order
+            if levels < max_levels:
+                levels += 1
+            elif window < max_window:
+                window = min(max_window, window + 2)
+            elif corners < max_corners:
+                corners = min(max_corners, int(corners * 1.25) + 1)
+        if (corners, window, levels) == current:
+            return
+        # Not applied right away: this frame's track_ages must still line up with its flow vectors
+        self.pending_budget_params = (corners, window, levels)
+        self.frames_since_adjustment = 0
+        print(f"Flow budget {self.time_budget_ms:.1f}ms (now {self.flow_ms:.1f}ms/frame): "
+              f"maxCorners {corners}, winSize {window}, maxLevel {levels}")
+
+    def _engine_scale(self):
+        return self.dense_scale if self.engine == "dense" else self.processing_scale
+
+    def _reset_tracks(self):
+        self.prev_frame = None
+        self.points = np.empty((0, 1, 2), dtype=np.float32)
+        self.track_ids = np.empty(0, dtype=np.int64)
+        self.track_ages = np.empty(0, dtype=np.int32)  # Frames each track has been followed
+        self.next_track_id = 0
+        self.detections = 0  # goodFeaturesToTrack calls
+
+    def get_tracks(self):
+        """Live tracks as (ids, (N, 2) full-frame points in the last frame, ages in frames)"""
+        return self.track_ids.copy(), self._to_frame(self.points), self.track_ages.copy()
+
+    def _geometry(self, shape):
+        """Crop rectangle, size, per-axis scale and feature mask of the processing image for a frame size"""
+        if self.geometry is not None and self.geometry[0] == shape:
+            return self.geometry
+        height, width = shape[:2]
+        mask = None
+        if self.roi is None:
+            x0, y0, x1, y1 = 0, 0, width, height
+        elif isinstance(self.roi, np.ndarray):
+            x0, y0, w, h = cv2.boundingRect((self.roi > 0).astype(np.uint8))
+            x1, y1 = x0 + w, y0 + h
+            mask = self.roi[y0:y1, x0:x1]
+        else:
+            rx, ry, rw, rh = self.roi
+            x0, y0 = int(rx * width), int(ry * height)
+            x1, y1 = int((rx + rw) * width), int((ry + rh) * height)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(width, max(x1, x0 + 1)), min(height, max(y1, y0 + 1))
+
+        engine_scale = self._engine_scale()
+        size = (max(1, round((x1 - x0) * engine_scale)),
+                max(1, round((y1 - y0) * engine_scale)))
+        if mask is not None:
+            mask = np.where(cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST) > 0, 255, 0).astype(np.uint8)
+        scale = (size[0] / (x1 - x0), size[1] / (y1 - y0))
+        self.geometry = (shape, (x0, y0, x1, y1), size, scale, mask)
+        return self.geometry
+
+    def _prepare(self, gray):
+        """The grayscale frame cropped to the ROI and resized to the processing scale"""
+        _, (x0, y0, x1, y1), size, _, _ = self._geometry(gray.shape)
+        work = gray[y0:y1, x0:x1]
+        if work.shape[::-1] != size:
+            # INTER_AREA only where bilinear would alias; at non-integer factors it costs ~3x more
+            interpolation = cv2.INTER_LINEAR if self._engine_scale() >= 0.5 else cv2.INTER_AREA
+            work = cv2.resize(work, size, interpolation=interpolation)
+        return work
+
+    def _to_frame(self, points):
+        """Processing-image points -> (N, 2) full-frame pixels"""
+        points = points.reshape(-1, 2)
+        if self.geometry is None:
+            return points.copy()
+        _, (x0, y0, _, _), _, (sx, sy), _ = self.geometry
+        # Pixel centres, as cv2.resize maps them
+        scale = np.array([sx, sy], dtype=np.float32)
+        return (points + 0.5) / scale - 0.5 + np.array([x0, y0], dtype=np.float32)
+
+    def _replenish_tracks(self, gray):
+        """Detect new corners away from the live tracks and append them with age 0"""
+        wanted = self.feature_params['maxCorners'] - len(self.points)
+        if wanted <= 0:
+            return
+        mask = self.geometry[4] if self.geometry is not None else None
+        if len(self.points):
+            mask = mask.copy() if mask is not None else np.full(gray.shape, 255, dtype=np.uint8)
+            for x, y in np.rint(self.points.reshape(-1, 2)).astype(np.int32):
+                cv2.circle(mask, (int(x), int(y)), self.feature_params['minDistance'], 0, -1)
+        params = dict(self.feature_params, maxCorners=wanted)
+        new_points = cv2.goodFeaturesToTrack(gray, mask=mask, **params)
+        self.detections += 1
+        if new_points is None:
+            return
+        count = len(new_points)
+        self.points = np.concatenate([self.points, new_points.astype(np.float32)])
+        self.track_ids = np.concatenate([self.track_ids, np.arange(self.next_track_id, self.next_track_id + count)])
+        self.track_ages = np.concatenate([self.track_ages, np.zeros(count, dtype=np.int32)])
+        self.next_track_id += count
+
     def register_movement_observer(self, observer):
         """Register an observer to receive movement updates"""
         self.movement_observers.append(observer)
@@ -45,87 +374,100 @@ class OpticalFlowController:
             self.movement_observers.remove(observer)
 
     def calculate_flow(self, current_frame):
-        """Calculate optical flow for all dimensions"""
-        current_gray = cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY)
+        """
+        Calculate optical flow for all dimensions. current_frame is a frame
+        or a FrameData; with FrameData the grayscale is shared with the
+        other consumers of the frame.
+        """
+        start = time.perf_counter()
+        result = self._calculate_flow(current_frame)
+        if self.time_budget_ms is not None and self.engine == "sparse":
+            self._adapt_to_budget((time.perf_counter() - start) * 1000.0)
+        return result
+
+    def _calculate_flow(self, current_frame):
+        if self.pending_budget_params is not None:
+            self._apply_budget_params(*self.pending_budget_params)
+            self.pending_budget_params = None
+        data = current_frame if isinstance(current_frame, FrameData) else FrameData(current_frame)
+        self.yaw = 0.0
+        self.inlier_ratio = None if self.estimator == "iqr" else 0.0
+        frame_shape = data.gray.shape
+        current_gray = self._prepare(data.gray)
         
         if self.prev_frame is None:
+            self._reset_tracks()
             self.prev_frame = current_gray
-            return 0, 0, 0, []
+            return 0, 0, 0, NO_FLOW_VECTORS
+        if self.engine == "dense":
+            return self._dense_flow(current_gray, frame_shape)
             
-        # Find features in previous frame
-        p0 = cv2.goodFeaturesToTrack(self.prev_frame, mask=None, **self.feature_params)
-        if p0 is None:
-            return 0, 0, 0, []
+        # Top up the tracks carried over from the previous frame
+        if len(self.points) < self.min_tracks:
+            self._replenish_tracks(self.prev_frame)
+        if len(self.points) == 0:
+            self.prev_frame = current_gray
+            return 0, 0, 0, NO_FLOW_VECTORS
         
-        # Calculate optical flow
+        # Track forward, then back again: a point that doesn't return to where it started is unreliable
+        p0 = self.points
         p1, status, err = cv2.calcOpticalFlowPyrLK(
             self.prev_frame, current_gray, p0, None, **self.lk_params
         )
+        p0r, status_back, err = cv2.calcOpticalFlowPyrLK(
+            current_gray, self.prev_frame, p1, None, **self.lk_params
+        )
+        fb_error = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (status_back.ravel() == 1) & (fb_error < self.fb_threshold)
         
-        # Select good points
-        good_new = p1[status == 1]
-        good_old = p0[status == 1]
-        
-        if len(good_new) > 0 and len(good_old) > 0:
-            # Calculate movements with outlier rejection
-            movements = self._calculate_movements_with_outliers(good_old, good_new, current_gray.shape)
-            self.prev_frame = current_gray
-            return movements
+        # Keep the good tracks for the next frame
+        self.points = p1[good]
+        self.track_ids = self.track_ids[good]
+        self.track_ages = self.track_ages[good] + 1
+        self.prev_frame = current_gray
         
+        if not good.any():
+            return 0, 0, 0, NO_FLOW_VECTORS
+
+        # Calculate movements, in full-frame pixels
+        return self._estimate(self._to_frame(p0[good]), self._to_frame(p1[good]), frame_shape)
+
+    def _dense_flow(self, current_gray, frame_shape):
+        """Dense DIS flow between the previous and current processing images, sampled on a grid"""
+        flow = self.dis.calc(self.prev_frame, current_gray, None)
         self.prev_frame = current_gray
-        return 0, 0, 0, []
+
+        height, width = current_gray.shape
+        step = self.dense_step
+        ys, xs = np.mgrid[step // 2:height:step, step // 2:width:step]
+        mask = self.geometry[4]
+        if mask is not None:
+            inside = mask[ys, xs] > 0
+            ys, xs = ys[inside], xs[inside]
+        old = np.stack([xs.ravel(), ys.ravel()], axis=1).astype(np.float32)
+        if len(old) == 0:
+            return 0, 0, 0, NO_FLOW_VECTORS
+        new = old + flow[ys.ravel(), xs.ravel()]
+        return self._estimate(self._to_frame(old), self._to_frame(new), frame_shape)
+
+    def _estimate(self, good_old, good_new, frame_shape):
+        """Movement from matched full-frame points with the configured estimator"""
+        if self.estimator == "similarity":
+            x, y, scale, flow_vectors, self.yaw, self.inlier_ratio = estimate_similarity(
+                good_old, good_new, frame_shape, self.ransac_threshold)
+            return x, y, scale, flow_vectors
+        return self._calculate_movements_with_outliers(good_old, good_new, frame_shape)
 
     def _calculate_movements_with_outliers(self, good_old, good_new, frame_shape):
         """Calculate movements in all dimensions with statistical outlier rejection"""
-        height, width = frame_shape
-        center_x, center_y = width / 2, height / 2
-        
-        x_movements = []
-        y_movements = []
-        scale_changes = []
-        flow_vectors = []
-        
-        for old_point, new_point in zip(good_old, good_new):
-            old_x, old_y = old_point.ravel()
-            new_x, new_y = new_point.ravel()
-            
-            # Calculate lateral movement
-            x_movements.append(new_x - old_x)
-            y_movements.append(new_y - old_y)
-            
-            # Calculate scale change for altitude estimation
-            old_dist = np.sqrt((old_x - center_x)**2 + (old_y - center_y)**2)
-            new_dist = np.sqrt((new_x - center_x)**2 + (new_y - center_y)**2)
-            
-            if old_dist > 0:
-                scale_change = (new_dist - old_dist) / old_dist
-                scale_changes.append(scale_change)
-            
-            flow_vectors.append((old_point.reshape(-1), (new_point - old_point).reshape(-1)))
-        
-        # Reject outliers
-        x_movement = self._reject_outliers(x_movements)
-        y_movement = self._reject_outliers(y_movements)
-        scale_change = self._reject_outliers(scale_changes) if scale_changes else 0
-        
-        return x_movement, y_movement, scale_change, flow_vectors
+        return estimate_motion(good_old, good_new, frame_shape)
 
     def _reject_outliers(self, data):
         """Reject outliers using IQR method"""
-        if not data:
-            return 0
-            
-        q1 = np.percentile(data, 25)
-        q3 = np.percentile(data, 75)
-        iqr = q3 - q1
-        lower_bound = q1 - 1.5 * iqr
-        upper_bound = q3 + 1.5 * iqr
-        
-        filtered_data = [x for x in data if lower_bound <= x <= upper_bound]
-        return np.mean(filtered_data) if filtered_data else 0
+        return reject_outliers(data)
 
     def process_frame(self, frame):
-        """Process a new frame and notify all observers"""
+        """Process a new frame (or its FrameData) and notify all observers"""
         if not self.running:
             return
             
@@ -134,28 +476,32 @@ class OpticalFlowController:
             x_movement, y_movement, scale_change, flow_vectors = self.calculate_flow(frame)
             
             # Update visualization
-            self.video_manager.update_flow_overlay(flow_vectors, scale_change)
+            self.video_manager.update_flow_overlay(flow_vectors, scale_change, self.source)
 
-            # Get barometer data from the controller
+            # Latest barometer reading from the controller's telemetry snapshot (never blocks)
             baro_data = None  # Initialize as None
             try:
                 baro_data = self.controller.get_barometer_data()
-            except:
+            except Exception:
                 pass  # Ignore barometer errors for now to keep video running
+            now = time.time()
 
             # Notify observers
-            movement_data = {
-                'x': x_movement,
-                'y': y_movement,
-                'scale': scale_change,
-                'timestamp': time.time(),
-                'is_takeoff': self.is_takeoff,
-                'flow_vectors': flow_vectors,
-                'baro_data': baro_data
-            }
+            sample = MovementSample(
+                x_movement, y_movement, scale_change, now,
+                is_takeoff=self.is_takeoff,
+                flow_vectors=flow_vectors,
+                track_ages=self.track_ages if self.engine == "sparse" else None,
+                yaw=self.yaw,
+                inlier_ratio=self.inlier_ratio,
+                baro_data=baro_data,
+                baro_age=now - baro_data['timestamp'] if baro_data else None,  # Seconds since it was received
+                history=self.history,
+            )
+            self.history.append(sample)
             
             for observer in self.movement_observers:
-                observer.on_movement(movement_data)
+                observer.on_movement(sample)
             
         except Exception as e:
             print(f"Error processing frame: {e}")
@@ -165,10 +511,12 @@ class OpticalFlowController:
         if not self.running:
             self.running = True
             self.is_takeoff = False
-            self.prev_frame = None
+            self._reset_tracks()
+            self.history.clear()
             self.integral_x = 0
             self.integral_y = 0
-            self.video_manager.subscribe(self.process_frame)
+            self.video_manager.subscribe(self.process_frame, self.source, policy="latest",
+                                         frame_data=True)
             self.video_manager.set_visualization(VisualizationType.OPTICAL_FLOW)
             print("Started position hold mode")
 
@@ -177,20 +525,22 @@ class OpticalFlowController:
         if not self.running:
             self.running = True
             self.is_takeoff = True
-            self.prev_frame = None
+            self._reset_tracks()
+            self.history.clear()
             self.integral_x = 0
             self.integral_y = 0
-            self.video_manager.subscribe(self.process_frame)
+            self.video_manager.subscribe(self.process_frame, self.source, policy="latest",
+                                         frame_data=True)
             self.video_manager.set_visualization(VisualizationType.OPTICAL_FLOW)
             print("Started takeoff hold mode")
 
     def stop(self):
         """Stop position holding"""
         self.running = False
-        # Clear any cached frames
-        self.prev_frame = None
+        # Clear any cached frames and tracks
+        self._reset_tracks()
         # Clear movement data
         self.integral_x = 0
         self.integral_y = 0
-        self.video_manager.unsubscribe(self.process_frame)
+        self.video_manager.unsubscribe(self.process_frame, self.source)
         print("Stopped optical flow controller")
\ No newline at end of file
@@ -0,0 +1,181 @@
+#overlay.py
+import cv2
+import numpy as np
+from threading import Lock
+
+
+class OverlayLayer:
+    """
+    One cached overlay layer. set() only swaps in new data; the layer is
+    redrawn the next time it is composited after a change (or when the
+    frame size changes), never on every frame.
+
+    A layer is a single-channel mask in one colour, so drawing touches a
+    quarter of the bytes of a colour canvas and compositing is one masked
+    copy over the bounding box of whatever was drawn.
+    """
+    def __init__(self, color=(0, 255, 0), thickness=2):
+        self.color = color
+        self.thickness = thickness
+        self.lock = Lock()
+        self.data = None
+        self.version = 0
+
+        # Render cache, owned by the compositing thread
+        self.mask = None
+        self.fill = None          # Solid colour image the mask selects from
+        self.roi = None           # (x, y, w, h) of everything drawn, or None if empty
+        self.rendered_version = -1
+
+    def set(self, data):
+        """Replace the layer's data (any thread); None clears it"""
+        with self.lock:
+            self.data = data
+            self.version += 1
+
+    def snapshot(self):
+        with self.lock:
+            return self.version, self.data
+
+    def render(self, shape):
+        """Redraw the cached mask if the data or frame size changed; returns the ROI"""
+        version, data = self.snapshot()
+        if self.mask is not None and self.fill.shape == shape and version == self.rendered_version:
+            return self.roi
+
+        if self.mask is None or self.fill.shape != shape:
+            self.mask = np.zeros(shape[:2], np.uint8)
+            self.fill = np.empty(shape, np.uint8)
+            self.fill[:] = self.color if len(shape) == 3 else max(self.color)
+        elif self.roi is not None:
+            x, y, w, h = self.roi
+            self.mask[y:y + h, x:x + w] = 0
+
+        self.roi = None
+        if data is not None:
+            self.draw(self.mask, data)
+            x, y, w, h = cv2.boundingRect(self.mask)
+            if w and h:
+                self.roi = (x, y, w, h)
+        self.rendered_version = version
+        return self.roi
+
+    def draw(self, mask, data):
+        """Draw data onto mask in 255"""
+        raise NotImplementedError
+
+
+class FlowLayer(OverlayLayer):
+    """Flow vectors ((x, y), (dx, dy)) as arrows, drawn with two polylines calls"""
+    tip_length = 0.1  # Same proportions as cv2.arrowedLine
+
+    def draw(self, mask, data):
+        flow_vectors, _ = data
+        vectors = np.asarray(flow_vectors, dtype=np.float32).reshape(-1, 4)
+        if len(vectors) == 0:
+            return
+        start, delta = vectors[:, :2], vectors[:, 2:]
+        end = start + delta
+
+        shafts = np.stack([start, end], axis=1)
+        cv2.polylines(mask, np.rint(shafts).astype(np.int32), False, 255, self.thickness)
+
+        # Arrow heads: two barbs at +-45 degrees from the reversed vector
+        length = np.hypot(delta[:, 0], delta[:, 1])
+        moving = length >= 1.0
+        if not moving.any():
+            return
+        tip = (length[moving] * self.tip_length)[:, None]
+        angle = np.arctan2(-delta[moving, 1], -delta[moving, 0])[:, None]
+        end = end[moving]
+        left = end + tip * np.hstack([np.cos(angle + np.pi / 4), np.sin(angle + np.pi / 4)])
+        right = end + tip * np.hstack([np.cos(angle - np.pi / 4), np.sin(angle - np.pi / 4)])
+        heads = np.stack([left, end, right], axis=1)
+        cv2.polylines(mask, np.rint(heads).astype(np.int32), False, 255, self.thickness)
+
+
+class DetectionLayer(OverlayLayer):
+    """Detector boxes (label, confidence, (x, y, w, h)) with one polylines call for all boxes"""
+    def draw(self, mask, data):
+        if not data:
+            return
+        boxes = np.array([box for _, _, box in data], dtype=np.int32).reshape(-1, 4)
+        x, y, w, h = boxes.T
+        corners = np.stack([
+            np.stack([x, y], axis=1),
+            np.stack([x + w, y], axis=1),
+            np.stack([x + w, y + h], axis=1),
+            np.stack([x, y + h], axis=1),
+        ], axis=1)
+        cv2.polylines(mask, corners, True, 255, self.thickness)
+
+        for (label, confidence, _), (bx, by) in zip(data, boxes[:, :2]):
+            cv2.putText(mask, f"{label}: {confidence:.2f}", (int(bx), int(by) - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, 255, 2)
+
+
+class TargetLayer(OverlayLayer):
+    """The point the planner is flying towards: ((x, y) normalized to 0..1, label)"""
+    def draw(self, mask, data):
+        (x, y), label = data
+        height, width = mask.shape[:2]
+        center = (int(x * width), int(y * height))
+        cv2.drawMarker(mask, center, 255, cv2.MARKER_CROSS, 40, self.thickness)
+        cv2.circle(mask, center, 25, 255, self.thickness)
+        if label:
+            cv2.putText(mask, str(label), (center[0] + 30, center[1] - 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, 255, 2)
+
+
+class HudLayer(OverlayLayer):
+    """A few lines of status text in the top-left corner"""
+    def draw(self, mask, data):
+        for i, line in enumerate(data):
+            cv2.putText(mask, line, (10, 25 + 22 * i),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, 255, 2)
+
+
+class OverlayCompositor:
+    """
+    Per-source stack of overlay layers, blended onto a frame in one pass.
+
+    Producers call set(name, data), which only swaps a reference under the
+    layer's lock. compose() runs on the display thread: it re-renders the
+    layers whose data changed and copies each layer's colour through its
+    mask onto a reused copy of the frame. With nothing to draw the frame is
+    returned untouched, without a copy.
+    """
+    def __init__(self):
+        self.layers = {
+            "flow": FlowLayer(color=(0, 255, 0)),
+            "detections": DetectionLayer(color=(0, 255, 0)),
+            "target": TargetLayer(color=(0, 165, 255)),
+            "hud": HudLayer(color=(255, 255, 255)),
+        }
+        self.enabled = {name: True for name in self.layers}
+        self.output = None
+
+    def set(self, name, data):
+        self.layers[name].set(data)
+
+    def set_enabled(self, name, enabled):
+        self.enabled[name] = enabled
+
+    def compose(self, frame):
+        """Frame with all enabled layers drawn on it; the input frame is never modified"""
+        drawn = []
+        for name, layer in self.layers.items():
+            if self.enabled[name]:
+                roi = layer.render(frame.shape)
+                if roi is not None:
+                    drawn.append((layer, roi))
+        if not drawn:
+            return frame
+
+        if self.output is None or self.output.shape != frame.shape:
+            self.output = np.empty_like(frame)
+        np.copyto(self.output, frame)
+        for layer, (x, y, w, h) in drawn:
+            region = self.output[y:y + h, x:x + w]
+            cv2.copyTo(layer.fill[y:y + h, x:x + w], layer.mask[y:y + h, x:x + w], region)
+        return self.output
@@ -0,0 +1,137 @@
+#telemetry.py
+import time
+from queue import Queue, Empty
+from threading import Thread, Lock, current_thread
+
+
+class MessageQueue:
+    """
+    Messages of the given types (all types if None) received while it is
+    open; see TelemetrySnapshot.open_queue(). Usable as a context manager.
+    """
+    def __init__(self, snapshot, types=None):
+        self.snapshot = snapshot
+        self.types = set(types) if types else None
+        self.queue = Queue()
+
+    def accepts(self, msg_type):
+        return self.types is None or msg_type in self.types
+
+    def get(self, timeout=None):
+        """Next message, or None if none arrives within timeout (None = wait for ever)"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def close(self):
+        self.snapshot._remove_queue(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TelemetrySnapshot:
+    """
+    The one reader of a MAVLink connection, and the latest fields of every
+    message type it received, each with the time it arrived.
+
+    pymavlink's parser is not thread-safe and recv_match hands each
+    message to a single caller, so once start_reader() has run nothing
+    else may call recv_match. The reader thread receives everything and
+    fans it out:
+        get() / barometer()    non-blocking snapshot reads
+        wait_for(type)         block until the next message of a type
+        open_queue(types)      every message of some types, in order
+        listeners              called with every message (reader thread)
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.messages = {}   # type -> (fields, received_at)
+        self.listeners = []  # Called with every message, from the reader thread
+        self.queues = []     # Open MessageQueues
+        self.vehicle = None
+        self.running = False
+        self.reader_thread = None
+
+    def attach(self, vehicle):
+        """Receive every message vehicle parses (also wait_heartbeat before the reader starts)"""
+        self.vehicle = vehicle
+        vehicle.message_hooks.append(self._on_message)
+        return self
+
+    def start_reader(self):
+        if self.running or self.vehicle is None:
+            return self
+        self.running = True
+        self.reader_thread = Thread(target=self._reader_loop, name="mavlink-reader", daemon=True)
+        self.reader_thread.start()
+        return self
+
+    def stop_reader(self):
+        self.running = False
+        if self.reader_thread is not None and self.reader_thread is not current_thread():
+            self.reader_thread.join(timeout=1.0)
+        self.reader_thread = None
+
+    def update(self, msg, received_at=None):
+        msg_type = msg.get_type()
+        if msg_type == 'BAD_DATA':
+            return
+        received_at = time.time() if received_at is None else received_at
+        fields = msg.to_dict()
+        with self.lock:
+            self.messages[msg_type] = (fields, received_at)
+            queues = [q for q in self.queues if q.accepts(msg_type)]
+        for queue in queues:
+            queue.queue.put(msg)
+        for listener in self.listeners:
+            listener(msg)
+
+    def get(self, msg_type, max_age=None):
+        """(fields, received_at) of the newest msg_type, or None if there is none (or it is older than max_age)"""
+        with self.lock:
+            entry = self.messages.get(msg_type)
+        if entry is None or (max_age is not None and time.time() - entry[1] > max_age):
+            return None
+        return entry
+
+    def barometer(self, max_age=None):
+        """{'altitude': m, 'timestamp': when it was received} from the newest VFR_HUD, or None"""
+        entry = self.get('VFR_HUD', max_age)
+        if entry is None:
+            return None
+        fields, received_at = entry
+        return {'altitude': fields['alt'], 'timestamp': received_at}
+
+    def open_queue(self, types=None):
+        """MessageQueue of every message of types (None = all) from now until it is closed"""
+        queue = MessageQueue(self, types)
+        with self.lock:
+            self.queues.append(queue)
+        return queue
+
+    def wait_for(self, msg_type, timeout=None):
+        """The next msg_type message to arrive, or None after timeout seconds (None = wait for ever)"""
+        with self.open_queue([msg_type]) as queue:
+            return queue.get(timeout)
+
+    def _remove_queue(self, queue):
+        with self.lock:
+            if queue in self.queues:
+                self.queues.remove(queue)
+
+    def _on_message(self, connection, msg):
+        self.update(msg)
+
+    def _reader_loop(self):
+        while self.running:
+            try:
+                # Messages reach update() through the message hook
+                self.vehicle.recv_match(blocking=True, timeout=0.2)
+            except Exception as e:
+                print(f"MAVLink reader error: {e}")
+                time.sleep(0.1)
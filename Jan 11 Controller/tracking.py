@@ -0,0 +1,247 @@
+#tracking.py
+import cv2
+import numpy as np
+import math
+
+
+class DetectionScheduler:
+    """
+    Decides which frames get a full detector pass; the rest are handled by
+    BoxTracker. With adaptive=True the interval is re-derived from the
+    measured detector cost so that detection takes about target_load of
+    the inference stage's time.
+    """
+    def __init__(self, interval=5, adaptive=False, target_load=0.5,
+                 min_interval=1, max_interval=30):
+        self.interval = interval
+        self.adaptive = adaptive
+        self.target_load = target_load
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.frames_since_detection = None  # None = never detected
+
+        # Exponential moving averages (seconds)
+        self.alpha = 0.2
+        self.detect_time = None
+        self.track_time = None
+
+    def should_detect(self):
+        """True if the next frame should go through the detector"""
+        return (self.frames_since_detection is None
+                or self.frames_since_detection + 1 >= self.interval)
+
+    def frame_done(self, detected, elapsed):
+        """Record how a frame was handled and how long it took"""
+        if detected:
+            self.frames_since_detection = 0
+            self.detect_time = self._ema(self.detect_time, elapsed)
+        else:
+            self.frames_since_detection += 1
+            self.track_time = self._ema(self.track_time, elapsed)
+
+        if self.adaptive and self.detect_time is not None and self.track_time is not None:
+            self._adapt()
+
+    def reset(self):
+        """Force a detection on the next frame"""
+        self.frames_since_detection = None
+
+    def _ema(self, average, value):
+        return value if average is None else (1 - self.alpha) * average + self.alpha * value
+
+    def _adapt(self):
+        # Over an interval of n frames the stage spends detect + (n-1) * track;
+        # pick the smallest n that keeps the detector's share under target_load
+        track = self.track_time or 0.0
+        detect = self.detect_time
+        if detect <= track or self.target_load >= 1.0:
+            interval = self.min_interval
+        else:
+            interval = math.ceil((detect * (1 - self.target_load) / self.target_load + track)
+                                 / max(track, 1e-3))
+        self.interval = int(np.clip(interval, self.min_interval, self.max_interval))
+
+
+class Track:
+    """One tracked object: a stable ID, its last label/confidence and a float box"""
+    def __init__(self, track_id, label, confidence, box):
+        self.track_id = track_id
+        self.label = label
+        self.confidence = confidence
+        self.box = np.asarray(box, dtype=np.float32)  # x, y, w, h
+        self.points = None
+        self.age = 0            # frames since the track was created
+        self.since_detection = 0
+        self.lost = False       # tracker lost it; kept only to re-match the next detection
+
+
+def _iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax2, ay2 = a[0] + a[2], a[1] + a[3]
+    bx2, by2 = b[0] + b[2], b[1] + b[3]
+    iw = max(0.0, min(ax2, bx2) - max(a[0], b[0]))
+    ih = max(0.0, min(ay2, by2) - max(a[1], b[1]))
+    inter = iw * ih
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+class BoxTracker:
+    """
+    Carries detector boxes across the frames between detections.
+
+    On a detection frame, boxes are matched to existing tracks by IoU (same
+    label) so track IDs stay stable, and a handful of corners is picked
+    inside each box. On the frames in between, all tracks' corners go
+    through a single pyramidal LK call and each box is shifted (and
+    rescaled) by the median motion of its own points.
+    """
+    def __init__(self, iou_threshold=0.3, max_points=20, min_points=4):
+        self.iou_threshold = iou_threshold
+        self.max_points = max_points
+        self.min_points = min_points
+        self.tracks = []
+        self.next_id = 1
+        self.prev_gray = None
+
+        self.feature_params = dict(qualityLevel=0.01, minDistance=5, blockSize=5)
+        self.lk_params = dict(
+            winSize=(15, 15),
+            maxLevel=2,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+        )
+
+    def reset(self):
+        self.tracks = []
+        self.prev_gray = None
+
+    def update(self, frame, detections):
+        """Replace the tracked boxes with fresh detections, keeping IDs where they overlap"""
+        gray = self._gray(frame)
+        detections = detections or []
+
+        # Greedy IoU matching, best pairs first
+        pairs = []
+        for d, (label, _, box) in enumerate(detections):
+            for t, track in enumerate(self.tracks):
+                if track.label == label:
+                    iou = _iou(box, track.box)
+                    if iou >= self.iou_threshold:
+                        pairs.append((iou, d, t))
+        pairs.sort(reverse=True)
+
+        matched = {}
+        used_tracks = set()
+        for _, d, t in pairs:
+            if d not in matched and t not in used_tracks:
+                matched[d] = t
+                used_tracks.add(t)
+
+        tracks = []
+        for d, (label, confidence, box) in enumerate(detections):
+            if d in matched:
+                track = self.tracks[matched[d]]
+                track.confidence = confidence
+                track.box = np.asarray(box, dtype=np.float32)
+                track.age += 1
+            else:
+                track = Track(self.next_id, label, confidence, box)
+                self.next_id += 1
+            track.since_detection = 0
+            track.lost = False
+            track.points = self._seed_points(gray, track.box)
+            tracks.append(track)
+
+        self.tracks = tracks
+        self.prev_gray = gray
+        return self.tracks
+
+    def propagate(self, frame):
+        """Move every track to the new frame using sparse optical flow"""
+        gray = self._gray(frame)
+        if self.prev_gray is None or not self.tracks or gray.shape != self.prev_gray.shape:
+            self.prev_gray = gray
+            return self.tracks
+
+        live = [t for t in self.tracks if not t.lost and t.points is not None]
+        for track in self.tracks:
+            track.age += 1
+            track.since_detection += 1
+        if not live:
+            # Nothing textured enough to follow: boxes stay where they were detected
+            self.prev_gray = gray
+            return self.tracks
+
+        counts = [len(t.points) for t in live]
+        p0 = np.concatenate([t.points for t in live])
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, p0, None, **self.lk_params)
+        status = status.reshape(-1).astype(bool)
+
+        height, width = gray.shape[:2]
+        start = 0
+        for track, count in zip(live, counts):
+            old = p0[start:start + count].reshape(-1, 2)
+            new = p1[start:start + count].reshape(-1, 2)
+            ok = status[start:start + count]
+            start += count
+
+            old, new = old[ok], new[ok]
+            if len(new) < self.min_points:
+                # The next detection will pick it up again under the same ID
+                track.lost = True
+                continue
+
+            dx, dy = np.median(new - old, axis=0)
+            scale = self._median_scale(old, new)
+            x, y, w, h = track.box
+            cx, cy = x + w / 2 + dx, y + h / 2 + dy
+            w, h = w * scale, h * scale
+            track.box = np.array([cx - w / 2, cy - h / 2, w, h], dtype=np.float32)
+            track.points = new.reshape(-1, 1, 2).astype(np.float32)
+
+            if cx < 0 or cy < 0 or cx > width or cy > height:
+                track.lost = True  # Left the frame
+
+        self.prev_gray = gray
+        return self.tracks
+
+    def as_detections(self):
+        """Tracks in the (label, confidence, (x, y, w, h)) format of update_yolo_overlay"""
+        return [
+            (t.label, t.confidence, tuple(int(v) for v in t.box))
+            for t in self.tracks if not t.lost
+        ]
+
+    def as_tracks(self):
+        """Tracks as (track_id, label, confidence, (x, y, w, h))"""
+        return [
+            (t.track_id, t.label, t.confidence, tuple(int(v) for v in t.box))
+            for t in self.tracks if not t.lost
+        ]
+
+    def _gray(self, frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    def _seed_points(self, gray, box):
+        height, width = gray.shape[:2]
+        x, y, w, h = box
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(width, int(x + w)), min(height, int(y + h))
+        if x1 - x0 < 4 or y1 - y0 < 4:
+            return None
+        points = cv2.goodFeaturesToTrack(gray[y0:y1, x0:x1], maxCorners=self.max_points,
+                                         **self.feature_params)
+        if points is None:
+            return None
+        points[:, 0, 0] += x0
+        points[:, 0, 1] += y0
+        return points
+
+    def _median_scale(self, old, new):
+        # Ratio of spreads around each point set's centroid
+        old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+        new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+        valid = old_spread > 1.0
+        if valid.sum() < 2:
+            return 1.0
+        return float(np.clip(np.median(new_spread[valid] / old_spread[valid]), 0.8, 1.25))
@@ -1,17 +1,20 @@
 # video.py
 import cv2
 import numpy as np
-from threading import Thread, Lock
-from queue import Queue
+from threading import Thread, Lock, Condition, current_thread
+from queue import Queue, Full, Empty
+from collections import deque
 import time
-
-# ---- NEW IMPORT ----
-try:
-    from ultralytics import YOLOWorld
-    YOLO_AVAILABLE = True
-except ImportError:
-    YOLO_AVAILABLE = False
-    print("Warning: ultralytics is not installed. YOLO features will be unavailable.")
+import json
+from flight_recorder import FlightRecorder
+from frame_ring import FrameRing
+from tracking import DetectionScheduler, BoxTracker
+from detector import YOLO_AVAILABLE, WorldDetector
+from overlay import OverlayCompositor
+from headless import MjpegPreview, ControlSocket
+from camera_discovery import discover_cameras, find_receiver
+from frame_source import open_source
+from frame_data import FrameData
 
 class VisualizationType:
     """Enum for different visualization types"""
@@ -20,54 +23,349 @@ class VisualizationType:
     OPTICAL_FLOW = 2
     ALL = 3
 
-class VideoManager:
-    def __init__(self, device_id=1, buffer_size=5):
+class FrameRate:
+    """Rolling frames-per-second estimate for one pipeline stage"""
+    def __init__(self, window=30):
+        self.times = deque(maxlen=window)
+
+    def tick(self, timestamp=None):
+        self.times.append(timestamp if timestamp is not None else time.time())
+
+    @property
+    def fps(self):
+        if len(self.times) < 2:
+            return 0.0
+        span = self.times[-1] - self.times[0]
+        return (len(self.times) - 1) / span if span > 0 else 0.0
+
+class StageTimer:
+    """Rolling window of one stage's durations (seconds in, milliseconds out)"""
+    def __init__(self, window=100):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return None
+        return {
+            "mean_ms": 1000.0 * sum(samples) / len(samples),
+            "p95_ms": 1000.0 * samples[int(0.95 * (len(samples) - 1))],
+            "max_ms": 1000.0 * samples[-1],
+            "count": self.count,
+        }
+
+def _subscriber_name(callback):
+    return getattr(callback, "__qualname__", None) or type(callback).__name__
+
+class Subscriber:
+    """
+    One frame subscriber with its own worker thread and bounded queue, so
+    a slow callback only ever delays itself.
+
+    policy decides what happens when the callback falls behind capture:
+        "latest"       keep only the newest frame (a queue of one)
+        "drop_oldest"  keep the newest queue_size frames
+        "block"        capture waits for room, so every frame is delivered
+                       and the source slows to this subscriber's pace
+                       (meant for offline processing of files)
+
+    With frame_data=True the callback receives the frame's FrameData
+    (shared grayscale and downscales) instead of the bare frame.
+
+    holds_frames is how many frames the callback may keep referencing
+    after it returns (e.g. a recorder's own queue); with the queue and the
+    frame being processed it sizes the capture FrameRing (max_frames).
+    """
+    POLICIES = ("latest", "drop_oldest", "block")
+
+    def __init__(self, manager, callback, source, policy="drop_oldest", queue_size=5,
+                 frame_data=False, holds_frames=0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown subscriber policy '{policy}', expected one of {self.POLICIES}")
+        self.manager = manager
+        self.callback = callback
+        self.name = _subscriber_name(callback)
+        self.source = source
+        self.policy = policy
+        self.frame_data = frame_data
+        self.queue = Queue(maxsize=1 if policy == "latest" else queue_size)
+        self.holds_frames = holds_frames
+        self.running = False
+        self.thread = None
+
+        # Stats
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lag = None         # EMA of capture-to-callback delay (seconds)
+        self.max_lag = 0.0
+        self.rate = FrameRate()
+        self.timer = StageTimer()  # Callback durations, while timing is on
+
+    @property
+    def max_frames(self):
+        """Most captured frames this subscriber can reference at once"""
+        return self.queue.maxsize + 1 + self.holds_frames
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = Thread(target=self._run, name=f"video-sub-{self.source}-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not current_thread():
+            self.thread.join(timeout=1.0)
+        self.thread = None
+
+    def offer(self, data):
+        """Queue a captured frame's FrameData according to the policy (called by the capture thread)"""
+        if self.policy == "block":
+            while self.running and self.manager.running:
+                try:
+                    self.queue.put(data, timeout=0.1)
+                    return
+                except Full:
+                    continue
+            return
+
+        try:
+            self.queue.put_nowait(data)
+        except Full:
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except Empty:
+                pass
+            try:
+                self.queue.put_nowait(data)
+            except Full:
+                self.dropped += 1
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "queued": self.queue.qsize(),
+            "fps": self.rate.fps,
+            "lag_ms": self.lag * 1000.0 if self.lag is not None else None,
+            "max_lag_ms": self.max_lag * 1000.0,
+        }
+
+    def _run(self):
+        while self.running:
+            try:
+                data = self.queue.get(timeout=0.1)
+            except Empty:
+                continue
+
+            lag = time.time() - data.timestamp
+            self.lag = lag if self.lag is None else 0.9 * self.lag + 0.1 * lag
+            self.max_lag = max(self.max_lag, lag)
+
+            timing = self.manager.timing
+            if timing:
+                callback_start = time.perf_counter()
+            try:
+                self.callback(data if self.frame_data else data.frame)
+            except Exception as e:
+                self.errors += 1
+                print(f"Subscriber error ({self.name}): {str(e)}")
+            if timing:
+                self.timer.add(time.perf_counter() - callback_start)
+            data = None  # Release the ring slot while waiting for the next one
+            self.delivered += 1
+            self.rate.tick()
+
+class CameraStream:
+    """
+    Per-source state of a VideoManager: the capture device, its frame ring
+    and newest frame, its subscribers, detector schedule and tracker, and the
+    overlays drawn on its window.
+    """
+    def __init__(self, name, device_id, buffer_size=5, detection_interval=5,
+                 adaptive_detection=False):
+        self.name = name
         self.device_id = device_id
         self.camera = None
+        self.subscribers = []   # Subscriber workers
+        self.buffer_size = buffer_size
+
+        # Preallocated capture buffers: subscriber queues, the latest frame,
+        # inference and display may each hold some. The ring may grow to
+        # cover every subscriber's max_frames (see update_ring_capacity)
+        self.frame_ring = FrameRing(slots=buffer_size + 4, max_slots=2 * (buffer_size + 4))
+        self.latest_frame = None
+        self.latest_data = None  # FrameData of latest_frame
+        self.frame_index = 0
+
+        # Detect every N frames, track boxes in between
+        self.detection_scheduler = DetectionScheduler(detection_interval, adaptive_detection)
+        self.box_tracker = BoxTracker()
+        self.tracks = []
+
+        # Overlay layers: flow, detections, target, hud
+        self.overlays = OverlayCompositor()
+
+        self.stage_rates = {
+            "capture": FrameRate(),
+            "display": FrameRate(),
+        }
+        # Stage durations, filled only while VideoManager.timing is on
+        self.timers = {}
+        # Captured frames a stage never saw because it was busy
+        self.skipped = {"display": 0, "inference": 0}
+
+    def update_ring_capacity(self):
+        """Let the ring grow to every frame that can be referenced at once, so capture never runs out of slots"""
+        pipeline = self.buffer_size + 4  # Latest frame, inference, display, the frame being captured, slack
+        self.frame_ring.set_max_slots(pipeline + sum(s.max_frames for s in self.subscribers))
+
+    @property
+    def window_name(self):
+        return 'Drone Video Feed' if self.name == "main" else f'Drone Video Feed - {self.name}'
+
+class VideoManager:
+    """
+    Camera capture with a staged pipeline, each stage on its own thread:
+
+        capture    camera.read() as fast as the camera delivers (per source)
+        subscribe  one worker per subscriber, fed through its own bounded
+                   queue with a drop policy (see Subscriber)
+        inference  runs YOLO every detection_interval frames, batching the
+                   newest frame of every source into one predict call, and
+                   tracks the boxes in between
+        display    draws overlays and shows the newest frames at display_fps
+
+    A slow detector, display or subscriber only means that stage skips
+    frames; capture and every other consumer keep running at camera rate.
+
+    Frames are captured into a FrameRing and shared between all stages as
+    read-only numpy views. Each frame travels with a FrameData, so the
+    grayscale and downscaled copies derived from it are computed once
+    and shared by the tracker, the detector and frame_data subscribers.
+    Overlays are cached layers that are redrawn only when their data
+    changes and blended onto one reused copy of the frame per display (see
+    overlay.OverlayCompositor).
+
+    Several sources can be opened at once, e.g.
+        VideoManager(sources={"forward": 1, "down": 2})
+    Methods that take a `source` name default to the first one. A device
+    of None is resolved at start() to the discovered video receiver (see
+    camera_discovery.find_receiver). Instead of a device, a source can be
+    a video file, a directory of frames (e.g. "captured_frames"),
+    "synthetic" or any FrameSource (see frame_source.open_source); those
+    play at their own frame rate, or as fast as possible with
+    realtime=False.
+
+    The YOLO-World detector loads and warms up in the background; until it
+    is ready (`model` is None) the pipeline simply runs without detections.
+
+    With headless=True no window is opened: the annotated video is served
+    as MJPEG on http://127.0.0.1:<preview_port>/ at preview_fps and
+    preview_width (overlays are only composed while someone is watching),
+    and the keyboard is replaced by a line-based control socket on
+    control_port (see handle_command).
+    """
+    def __init__(self, device_id=None, buffer_size=5, display_fps=30, inference_fps=None,
+                 detection_interval=5, adaptive_detection=False, sources=None,
+                 headless=False, preview_port=8080, preview_fps=10, preview_width=640,
+                 control_port=8081, realtime=True, timing=False):
+        sources = sources or {"main": device_id}
+        self.streams = {
+            name: CameraStream(name, source_id, buffer_size, detection_interval, adaptive_detection)
+            for name, source_id in sources.items()
+        }
+        self.primary = next(iter(self.streams))
+        self.device_id = self.streams[self.primary].device_id
+        self.realtime = realtime
         self.running = False
         self.display_active = False
-        self.subscribers = []
         self.visualization_type = VisualizationType.NONE
-        
+
+        # Pipeline stages
+        self.display_fps = display_fps
+        self.inference_fps = inference_fps  # None = as fast as the model allows
+        self.workers = []
+        self.inference_rate = FrameRate()
+        self.detect_size = 640  # Frames go to YOLO shrunk to this longer side, as it would resize them anyway
+
+        # Per-stage timers (see stats()); off by default, and then free
+        self.timing = timing
+        self.inference_timers = {}
+
         # Overlays
         self.overlay_lock = Lock()
-        self.flow_overlay = None
-        self.yolo_overlay = None  # store YOLO results here
+        self.show_hud = False
+        self.hud_interval = 0.5
 
-        # For frame retrieval
+        # Headless operation
+        self.headless = headless
+        self.preview = MjpegPreview(port=preview_port, max_fps=preview_fps,
+                                    max_width=preview_width) if headless else None
+        self.control = ControlSocket(self.handle_command, port=control_port) if headless else None
+
+        # For frame retrieval; frame_ready is notified on every captured frame of any source
         self.frame_lock = Lock()
-        self.latest_frame = None
+        self.frame_ready = Condition(self.frame_lock)
+
+        # Optional FlightRecorder fed with every captured frame
+        self.recorder = None
+
+        # Set when the detector vocabulary changed; the inference stage drops stale tracks
+        self.vocabulary_changed = False
 
         # Debug
         self.debug = True
 
-        # If ultralytics is installed, load YOLO model
+        # If ultralytics is installed, load the YOLO model in the background
         if YOLO_AVAILABLE:
-            # Initialize a YOLO-World model
-            self.model = YOLOWorld("yolov8s-world.pt")  # pick any variant
-            # Define custom classes (optional)
-            self.model.set_classes(["person", "bus"])
-            if self.debug:
-                print("YOLOWorld model loaded successfully.")
+            self.detector = WorldDetector("yolov8s-world.pt", ["person", "bus"],
+                                          debug=self.debug).load_async()
         else:
-            self.model = None
+            self.detector = None
+
+    @property
+    def model(self):
+        """The YOLO-World model, or None until it has finished loading"""
+        return self.detector.model if self.detector is not None else None
+
+    def _stream(self, source=None):
+        return self.streams[source if source is not None else self.primary]
 
     def start(self):
         """Start video capture with simpler display loop"""
         try:
-            print(f"Attempting to open video device {self.device_id}")
-            self.camera = cv2.VideoCapture(self.device_id)
-            
-            # Set camera parameters
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-            
-            if not self.camera.isOpened():
-                raise ValueError(f"Failed to open video device {self.device_id}")
+            for stream in self.streams.values():
+                if stream.device_id is None:
+                    stream.device_id = find_receiver()
+                    if stream.name == self.primary:
+                        self.device_id = stream.device_id
+                print(f"Attempting to open video source {stream.device_id} ({stream.name})")
+                # Live devices are set to 1280x720
+                stream.camera = open_source(stream.device_id, realtime=self.realtime)
+                
+                if not stream.camera.isOpened():
+                    raise ValueError(f"Failed to open video source {stream.device_id}")
             
             self.running = True
-            # For this demo, we assume we always want to display
-            self.display_active = True
+            # Without a GUI the display stage only feeds the MJPEG preview
+            self.display_active = not self.headless
+
+            # Capture, subscribers and inference run in the background
+            self._start_workers()
+            if self.headless:
+                self.preview.start(self.streams)
+                self.control.start()
 
             # Run the display in the main thread
             self._run_display_loop()
@@ -82,177 +380,549 @@ class VideoManager:
         """Stop video capture"""
         self.running = False
         self.display_active = False
-        if self.camera:
-            self.camera.release()
-        cv2.destroyAllWindows()
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        for worker in self.workers:
+            if worker is not current_thread():
+                worker.join(timeout=1.0)
+        self.workers = []
+        for stream in self.streams.values():
+            for subscriber in stream.subscribers:
+                subscriber.stop()
+        for stream in self.streams.values():
+            if stream.camera:
+                stream.camera.release()
+        if self.headless:
+            self.preview.stop()
+            self.control.stop()
+        else:
+            cv2.destroyAllWindows()
         print("Video manager stopped")
 
-    def list_available_cameras(self):
-        """List all available video devices"""
-        available_devices = []
-        for i in range(10):  # Check first 10 indices
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret:
-                    print(f"Found working device at index {i}")
-                    print(f"Resolution: {frame.shape}")
-                    print(f"Backend: {cap.getBackendName()}")
-                    print(f"FPS: {cap.get(cv2.CAP_PROP_FPS)}")
-                    print("---")
-                cap.release()
-
-    def get_frame(self):
-        """Get the latest frame"""
+    def get_stage_fps(self, source=None):
+        """Current rate of each pipeline stage of a source in frames per second"""
+        stream = self._stream(source)
+        fps = {stage: rate.fps for stage, rate in stream.stage_rates.items()}
+        fps["inference"] = self.inference_rate.fps
+        return fps
+
+    def set_timing(self, enabled):
+        """Turn per-stage timers on or off; turning them on starts from empty windows"""
+        if enabled and not self.timing:
+            self.inference_timers = {}
+            for stream in self.streams.values():
+                stream.timers = {}
+                for subscriber in stream.subscribers:
+                    subscriber.timer = StageTimer()
+        self.timing = enabled
+
+    def stats(self):
+        """
+        Pipeline statistics: per source the stage rates, stage durations
+        (read, overlay, show, sub:<index>:<callback>; only with timing on),
+        dropped/skipped frame counts and per-subscriber lag and drops (keyed
+        <index>:<callback>), plus the shared inference stage (predict, track)
+        """
+        sources = {}
+        for name, stream in self.streams.items():
+            subscribers = list(stream.subscribers)
+            # Several subscribers can share a callback name; the index keeps them apart
+            keys = [f"{i}:{subscriber.name}" for i, subscriber in enumerate(subscribers)]
+            timings = {stage: timer.summary() for stage, timer in list(stream.timers.items())}
+            for key, subscriber in zip(keys, subscribers):
+                if subscriber.timer.count:
+                    timings["sub:" + key] = subscriber.timer.summary()
+            sources[name] = {
+                "fps": {stage: rate.fps for stage, rate in stream.stage_rates.items()},
+                "timings": timings,
+                "subscribers": {key: subscriber.stats() for key, subscriber in zip(keys, subscribers)},
+                "dropped": {
+                    "subscribers": sum(subscriber.dropped for subscriber in subscribers),
+                    "ring_misses": stream.frame_ring.misses,
+                    "display_skipped": stream.skipped["display"],
+                    "inference_skipped": stream.skipped["inference"],
+                },
+                "frames": stream.frame_index,
+            }
+        return {
+            "timing": self.timing,
+            "sources": sources,
+            "inference": {
+                "fps": self.inference_rate.fps,
+                "timings": {stage: timer.summary()
+                            for stage, timer in list(self.inference_timers.items())},
+            },
+        }
+
+    def _timed(self, timers, stage, start):
+        """Record the time since start (perf_counter) for a stage; only called with timing on"""
+        timer = timers.get(stage)
+        if timer is None:
+            timer = timers[stage] = StageTimer()
+        timer.add(time.perf_counter() - start)
+
+    def list_available_cameras(self, refresh=True):
+        """List all available video devices (probed in parallel); returns their info dicts"""
+        available_devices = [c for c in discover_cameras(refresh=refresh) if c["ok"]]
+        for camera in available_devices:
+            print(f"Found working device at index {camera['index']} ({camera.get('name') or camera['path']})")
+            print(f"Resolution: {camera['width']}x{camera['height']}")
+            print(f"Backend: {camera['backend']}")
+            print(f"FPS: {camera['fps']}")
+            modes = ", ".join(f"{m['width']}x{m['height']}" for m in camera.get("modes", []))
+            if modes:
+                print(f"Modes: {modes}")
+            print("---")
+        return available_devices
+
+    def get_frame(self, source=None):
+        """Get the latest frame (a shared read-only view; copy() it before drawing on it)"""
         with self.frame_lock:
-            return self.latest_frame.copy() if self.latest_frame is not None else None
+            return self._stream(source).latest_frame
+
+    def get_frame_data(self, source=None):
+        """FrameData of the latest frame, sharing its derived grayscale and downscales"""
+        with self.frame_lock:
+            return self._stream(source).latest_data
 
     def set_visualization(self, viz_type):
         """Set the visualization type"""
         with self.overlay_lock:
             self.visualization_type = viz_type
 
-    def subscribe(self, callback):
-        """Subscribe to receive frames"""
-        self.subscribers.append(callback)
+    def set_detection_interval(self, interval, adaptive=False, source=None):
+        """Run the detector every `interval` frames (or adapt it to detector cost); all sources by default"""
+        streams = [self._stream(source)] if source is not None else self.streams.values()
+        for stream in streams:
+            stream.detection_scheduler.interval = max(1, int(interval))
+            stream.detection_scheduler.adaptive = adaptive
+            stream.detection_scheduler.reset()
+
+    def set_classes(self, classes, block=False):
+        """
+        Swap the YOLO class list mid-flight without reloading weights. The
+        capture loop never waits; detection keeps the old classes until the
+        new embeddings are in place. Returns the switch report when block
+        is set (latency_ms, cached / encoded classes), otherwise None.
+        """
+        if self.detector is None:
+            print("Cannot set classes: YOLO is not available")
+            return None
+        return self.detector.set_classes(classes, block, on_done=self._on_vocabulary_switched)
+
+    def _on_vocabulary_switched(self, report):
+        self.vocabulary_changed = True
+        if self.recorder is not None:
+            self.recorder.record_event("vocabulary", report)
+
+    def get_tracks(self, source=None):
+        """Current tracked objects as (track_id, label, confidence, (x, y, w, h))"""
+        with self.overlay_lock:
+            return list(self._stream(source).tracks)
+
+    def subscribe(self, callback, source=None, policy="drop_oldest", queue_size=None,
+                  frame_data=False, holds_frames=0):
+        """
+        Subscribe to receive frames from one source. The callback runs on
+        its own worker; policy ("latest", "drop_oldest" or "block") says
+        what to do with frames it can't keep up with (see Subscriber).
+        With frame_data=True it receives FrameData objects instead of frames.
+        holds_frames: frames the callback keeps after returning.
+        """
+        stream = self._stream(source)
+        subscriber = Subscriber(self, callback, stream.name, policy,
+                                queue_size or stream.buffer_size, frame_data, holds_frames)
+        stream.subscribers.append(subscriber)
+        stream.update_ring_capacity()
+        if self.running:
+            subscriber.start()
         if self.debug:
-            print(f"Added new subscriber, total subscribers: {len(self.subscribers)}")
-
-    def unsubscribe(self, callback):
-        """Remove a frame subscriber"""
-        if callback in self.subscribers:
-            self.subscribers.remove(callback)
-            if self.debug:
-                print(f"Removed subscriber, remaining subscribers: {len(self.subscribers)}")
-
-    def update_yolo_overlay(self, detections):
+            print(f"Added new subscriber to {stream.name} ({subscriber.name}, {policy}), "
+                  f"total subscribers: {len(stream.subscribers)}")
+
+    def unsubscribe(self, callback, source=None):
+        """Remove a frame subscriber (from every source unless one is given)"""
+        streams = [self._stream(source)] if source is not None else self.streams.values()
+        for stream in streams:
+            for subscriber in [s for s in stream.subscribers if s.callback == callback]:
+                stream.subscribers.remove(subscriber)
+                subscriber.stop()
+                stream.update_ring_capacity()
+                if self.debug:
+                    print(f"Removed subscriber from {stream.name}, remaining subscribers: {len(stream.subscribers)}")
+
+    def start_recording(self, recorder=None, output_dir="flights", source=None):
+        """Record captured frames (and detections) of one source to a FlightRecorder"""
+        if self.recorder is not None:
+            return self.recorder
+        self.recorder = recorder or FlightRecorder(output_dir).start()
+        # The recorder's own queue keeps up to queue_size frames, plus the one being encoded
+        self.subscribe(self.recorder.record_frame, source, frame_data=True,
+                       holds_frames=self.recorder.queue_size + 1)
+        return self.recorder
+
+    def stop_recording(self):
+        """Stop feeding the recorder; the caller owns stopping it if it passed one in"""
+        if self.recorder is None:
+            return
+        self.unsubscribe(self.recorder.record_frame)
+        self.recorder = None
+
+    def handle_command(self, line):
+        """
+        Run one control command (the headless replacement for the video
+        window's keyboard); returns the reply text.
+
+            q | quit                      stop the video manager
+            viz none|yolo|flow|all        choose overlays
+            hud on|off                    show per-stage rates
+            classes person,car,...        switch the detector vocabulary
+            interval N [adaptive]         detection interval
+            fps [source]                  per-stage rates
+            timing on|off                 per-stage timers
+            stats                         stats() as JSON
+        """
+        words = line.split()
+        command, args = words[0].lower(), words[1:]
+        if command in ("q", "quit"):
+            self.running = False
+            with self.frame_ready:
+                self.frame_ready.notify_all()
+            return "ok"
+        if command == "viz":
+            viz_types = {
+                "none": VisualizationType.NONE,
+                "yolo": VisualizationType.YOLO,
+                "flow": VisualizationType.OPTICAL_FLOW,
+                "all": VisualizationType.ALL,
+            }
+            if not args or args[0] not in viz_types:
+                return "error: viz none|yolo|flow|all"
+            self.set_visualization(viz_types[args[0]])
+            return "ok"
+        if command == "hud":
+            self.show_hud = bool(args) and args[0] == "on"
+            if not self.show_hud:
+                for name in self.streams:
+                    self.update_hud(None, name)
+            return "ok"
+        if command == "classes":
+            classes = [c.strip() for c in " ".join(args).split(",") if c.strip()]
+            if not classes:
+                return "error: classes name[,name...]"
+            self.set_classes(classes)
+            return "ok"
+        if command == "interval":
+            self.set_detection_interval(int(args[0]), adaptive="adaptive" in args[1:])
+            return "ok"
+        if command == "timing":
+            self.set_timing(bool(args) and args[0] == "on")
+            return "ok"
+        if command == "stats":
+            return json.dumps(self.stats())
+        if command == "fps":
+            fps = self.get_stage_fps(args[0] if args else None)
+            return " ".join(f"{stage}={rate:.1f}" for stage, rate in fps.items())
+        return f"error: unknown command '{command}'"
+
+    def update_yolo_overlay(self, detections, source=None):
         """Update YOLO detection overlay"""
-        with self.overlay_lock:
-            self.yolo_overlay = detections
-
-    def update_flow_overlay(self, flow_vectors, z_movement=None):
-        """Update optical flow overlay"""
-        with self.overlay_lock:
-            self.flow_overlay = (flow_vectors, z_movement)
-
-    def _apply_yolo_overlay(self, frame):
-        """Apply YOLO detection boxes to frame"""
-        if self.yolo_overlay is None:
-            return frame
-
-        overlay = frame.copy()
-        for label, confidence, (x, y, w, h) in self.yolo_overlay:
-            # Draw bounding box
-            cv2.rectangle(overlay, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            # Draw label
-            text = f"{label}: {confidence:.2f}"
-            cv2.putText(overlay, text, (x, y - 10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        return overlay
-
-    def _apply_flow_overlay(self, frame):
-        """Apply optical flow visualization to frame"""
-        if self.flow_overlay is None:
-            return frame
-
-        overlay = frame.copy()
-        flow_vectors, z_movement = self.flow_overlay
-
-        # Draw flow vectors
-        for vector in flow_vectors:
-            x, y = vector[0]
-            dx, dy = vector[1]
-            cv2.arrowedLine(overlay, 
-                            (int(x), int(y)), 
-                            (int(x + dx), int(y + dy)),
-                            (0, 255, 0), 2)
-
-        return overlay
-
-    def _run_display_loop(self):
-        """Simple display loop similar to your working code"""
-        print("Starting display loop")
-        
+        stream = self._stream(source)
+        stream.overlays.set("detections", detections or None)
+        if self.recorder is not None and detections:
+            self.recorder.record_event("detections", {"source": stream.name, "boxes": detections})
+
+    def update_flow_overlay(self, flow_vectors, z_movement=None, source=None):
+        """Update optical flow overlay (the vectors must not be modified afterwards)"""
+        data = (flow_vectors, z_movement) if len(flow_vectors) else None
+        self._stream(source).overlays.set("flow", data)
+
+    def update_target_overlay(self, target, label=None, source=None):
+        """Mark the point the drone is flying towards, (x, y) normalized to 0..1; None clears it"""
+        self._stream(source).overlays.set("target", (target, label) if target is not None else None)
+
+    def update_hud(self, lines, source=None):
+        """Show a few lines of status text on a source's window; None clears it"""
+        self._stream(source).overlays.set("hud", list(lines) if lines else None)
+
+    def _refresh_hud(self):
+        inference_timings = self._hud_timings(self.inference_timers)
+        for name, stream in self.streams.items():
+            fps = self.get_stage_fps(name)
+            lines = [
+                f"{name}: capture {fps['capture']:.0f} fps  display {fps['display']:.0f} fps",
+                f"inference {fps['inference']:.1f} fps  detect every "
+                f"{stream.detection_scheduler.interval} frames",
+            ]
+            if self.timing:
+                lines.append(self._hud_timings(stream.timers))
+                lines.append(inference_timings)
+                dropped = sum(subscriber.dropped for subscriber in stream.subscribers)
+                lines.append(f"dropped {dropped}  skipped display "
+                             f"{stream.skipped['display']} inference {stream.skipped['inference']}")
+            self.update_hud(lines, name)
+
+    def _hud_timings(self, timers):
+        parts = []
+        for stage, timer in list(timers.items()):
+            summary = timer.summary()
+            if summary:
+                parts.append(f"{stage} {summary['mean_ms']:.1f}ms")
+        return "  ".join(parts) or "no timings yet"
+
+    def _start_workers(self):
+        """Start a capture thread per source, every subscriber's worker and the shared inference thread"""
+        self.workers = []
+        for stream in self.streams.values():
+            for subscriber in stream.subscribers:
+                subscriber.start()
+            self.workers.append(Thread(target=self._capture_loop, args=(stream,),
+                                       name=f"video-capture-{stream.name}", daemon=True))
+        self.workers.append(Thread(target=self._inference_loop, name="video-inference", daemon=True))
+        for worker in self.workers:
+            worker.start()
+
+    def _wait_for_new_frames(self, last_indices, timeout):
+        """
+        Block until any source has a frame newer than last_indices[name];
+        returns {name: (index, FrameData)} for the sources that do
+        """
+        with self.frame_ready:
+            def fresh():
+                return {
+                    name: (stream.frame_index, stream.latest_data)
+                    for name, stream in self.streams.items()
+                    if stream.frame_index != last_indices.get(name, 0)
+                }
+            new_frames = fresh()
+            if not new_frames and self.running:
+                self.frame_ready.wait(timeout)
+                new_frames = fresh()
+            return new_frames
+
+    def _capture_loop(self, stream):
+        """Stage 1: read frames from one source as fast as the camera delivers them"""
         while self.running:
-            ret, frame = self.camera.read()
+            timing = self.timing
+            if timing:
+                read_start = time.perf_counter()
+            # Decode straight into a free ring slot when there is one
+            buffer = stream.frame_ring.acquire()
+            if buffer is not None:
+                ret, frame = stream.camera.read(buffer)
+            else:
+                ret, frame = stream.camera.read()
+            buffer = None  # Don't pin the slot past this frame
+            if timing and ret:
+                self._timed(stream.timers, "read", read_start)
             if not ret or frame is None:
+                if stream.camera.finished:
+                    print(f"Source {stream.name} has no more frames")
+                    break
+                time.sleep(0.005)
+                continue
+            captured_at = time.time()
+            stream.stage_rates["capture"].tick(captured_at)
+
+            if not stream.frame_ring.matches(frame):
+                # First frame, or the camera changed resolution
+                stream.frame_ring.resize(frame.shape, frame.dtype)
+            frame = FrameRing.publish(frame)
+            data = FrameData(frame, stream.frame_index + 1, captured_at)
+
+            # Store the latest frame for external use (get_frame) and the other stages
+            with self.frame_ready:
+                stream.latest_frame = frame
+                stream.latest_data = data
+                stream.frame_index += 1
+                self.frame_ready.notify_all()
+
+            # Stage 2: every subscriber's queue gets the same read-only frame
+            for subscriber in list(stream.subscribers):
+                subscriber.offer(data)
+            frame = data = None  # Don't pin the slot while waiting for the next read
+
+    def _inference_loop(self):
+        """
+        Stage 3: run YOLO every detection_interval frames, with the newest
+        frame of every source that is due batched into a single predict
+        call, and propagate the boxes with the tracker in between, skipping
+        any frames it couldn't keep up with
+        """
+        last_indices = {}
+        while self.running:
+            new_frames = self._wait_for_new_frames(last_indices, timeout=0.1)
+            if not new_frames:
                 continue
+            for name, (index, _) in new_frames.items():
+                if name in last_indices:
+                    self.streams[name].skipped["inference"] += index - last_indices[name] - 1
+                last_indices[name] = index
 
-            # Store the latest frame for external use (get_frame)
-            with self.frame_lock:
-                self.latest_frame = frame.copy()
-            
-            # -----------------------------
-            # 1. Run YOLO inference if requested
-            # -----------------------------
-            if (
-                self.model 
+            if not (
+                self.model
                 and self.visualization_type in [VisualizationType.YOLO, VisualizationType.ALL]
             ):
-                # Run prediction on the current frame (BGR -> model handles internally)
-                results = self.model.predict(frame, verbose=False)
-
-                # If results come back successfully, parse them
-                if len(results) > 0:
-                    detection_info = []
-                    # Each 'results' item can contain multiple boxes
-                    for r in results:
-                        for box in r.boxes:
-                            # box.xyxy, box.xywh, box.conf, box.cls, etc.
-                            x1, y1, x2, y2 = box.xyxy[0]  # bounding box corners
-                            conf = float(box.conf[0])     # confidence
-                            cls_id = int(box.cls[0])      # class ID
-                            
-                            # If you defined custom classes with .set_classes(), 
-                            # then model.names[cls_id] gives the correct label
-                            label = self.model.names[cls_id] if self.model.names else f"class_{cls_id}"
-                            
-                            w = x2 - x1
-                            h = y2 - y1
-                            detection_info.append(
-                                (label, conf, (int(x1), int(y1), int(w), int(h)))
-                            )
-                    # Update the YOLO overlay
-                    self.update_yolo_overlay(detection_info)
-                else:
-                    # If no results, clear the overlay
-                    self.update_yolo_overlay(None)
-
-            # -----------------------------
-            # 2. Prepare display frame (apply overlays)
-            # -----------------------------
-            display_frame = frame.copy()
-
-            # Apply YOLO boxes if YOLO or ALL is active
-            if self.visualization_type in [VisualizationType.YOLO, VisualizationType.ALL]:
-                with self.overlay_lock:
-                    display_frame = self._apply_yolo_overlay(display_frame)
-
-            # Apply optical flow overlay if requested
-            if self.visualization_type in [VisualizationType.OPTICAL_FLOW, VisualizationType.ALL]:
-                with self.overlay_lock:
-                    display_frame = self._apply_flow_overlay(display_frame)
+                for stream in self.streams.values():
+                    if stream.box_tracker.tracks:
+                        stream.box_tracker.reset()
+                        stream.detection_scheduler.reset()
+                continue
 
-            # -----------------------------
-            # 3. Show the frame
-            # -----------------------------
-            cv2.imshow('Drone Video Feed', display_frame)
+            if self.vocabulary_changed:
+                # Old labels mean nothing under the new vocabulary: re-detect everywhere
+                self.vocabulary_changed = False
+                for stream in self.streams.values():
+                    stream.box_tracker.reset()
+                    stream.detection_scheduler.reset()
+
+            start = time.time()
+            try:
+                due, between = [], []
+                for name, (_, data) in new_frames.items():
+                    stream = self.streams[name]
+                    if stream.detection_scheduler.should_detect():
+                        due.append((stream, data))
+                    else:
+                        between.append((stream, data))
+
+                if due:
+                    batch = self._run_detection([data for _, data in due])
+                    for (stream, data), detections in zip(due, batch):
+                        stream.box_tracker.update(data.gray, detections)
+                    # Each source is charged its share of the batched call
+                    share = (time.time() - start) / len(due)
+                    for stream, _ in due:
+                        stream.detection_scheduler.frame_done(True, share)
+
+                for stream, data in between:
+                    track_start = time.perf_counter()
+                    stream.box_tracker.propagate(data.gray)
+                    stream.detection_scheduler.frame_done(False, time.perf_counter() - track_start)
+                    if self.timing:
+                        self._timed(self.inference_timers, "track", track_start)
+
+                for name in new_frames:
+                    stream = self.streams[name]
+                    with self.overlay_lock:
+                        stream.tracks = stream.box_tracker.as_tracks()
+                    detections = stream.box_tracker.as_detections()
+                    self.update_yolo_overlay(detections if detections else None, name)
+            except Exception as e:
+                print(f"Inference error: {str(e)}")
+            self.inference_rate.tick()
+
+            if self.inference_fps:
+                remaining = 1.0 / self.inference_fps - (time.time() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+    def _run_detection(self, frames):
+        """
+        Run YOLO on a batch of FrameData in one predict call; returns one
+        [(label, confidence, (x, y, w, h)), ...] list per frame, in full
+        frame pixels
+        """
+        # The shared detect_size downscale spares YOLO its own resize of the full frame
+        downscales = [data.downscale(self.detect_size) for data in frames]
+
+        # Run prediction on the batch (BGR -> model handles internally)
+        timing = self.timing
+        if timing:
+            predict_start = time.perf_counter()
+        results = self.detector.predict([image for image, _ in downscales])
+        if timing:
+            self._timed(self.inference_timers, "predict", predict_start)
+
+        batch = []
+        # Each 'results' item holds the boxes of one frame
+        for r, (_, scale) in zip(results, downscales):
+            detection_info = []
+            for box in r.boxes:
+                # box.xyxy, box.xywh, box.conf, box.cls, etc.
+                x1, y1, x2, y2 = (float(v) / scale for v in box.xyxy[0])  # bounding box corners
+                conf = float(box.conf[0])     # confidence
+                cls_id = int(box.cls[0])      # class ID
+                
+                # The result carries the names of the vocabulary it was predicted
+                # with, which may since have been switched by set_classes()
+                label = r.names[cls_id] if r.names else f"class_{cls_id}"
+                
+                w = x2 - x1
+                h = y2 - y1
+                detection_info.append(
+                    (label, conf, (int(x1), int(y1), int(w), int(h)))
+                )
+            batch.append(detection_info)
+        return batch
 
-            # -----------------------------
-            # 4. Notify any subscribers
-            # -----------------------------
-            for subscriber in self.subscribers:
-                try:
-                    subscriber(frame.copy())
-                except Exception as e:
-                    print(f"Subscriber error: {str(e)}")
+    def _run_display_loop(self):
+        """
+        Stage 4: show the newest frame of each source with overlays at
+        display_fps (GUI thread), or in headless mode hand it to the MJPEG
+        preview when a viewer is due a frame
+        """
+        print("Starting display loop" + (" (headless)" if self.headless else ""))
+        interval = 1.0 / self.display_fps
+        last_indices = {}
+        last_hud = 0.0
+        
+        while self.running:
+            loop_start = time.time()
+            if self.show_hud and loop_start - last_hud >= self.hud_interval:
+                self._refresh_hud()
+                last_hud = loop_start
+            new_frames = self._wait_for_new_frames(last_indices, timeout=interval)
+
+            timing = self.timing
+            for name, (index, data) in new_frames.items():
+                stream = self.streams[name]
+                frame = data.frame
+                if name in last_indices and not self.headless:
+                    stream.skipped["display"] += index - last_indices[name] - 1
+                last_indices[name] = index
+                if self.headless and not self.preview.wants(name):
+                    continue
+
+                # -----------------------------
+                # 1. Prepare display frame (apply overlays)
+                # -----------------------------
+                viz = self.visualization_type
+                stream.overlays.set_enabled(
+                    "detections", viz in [VisualizationType.YOLO, VisualizationType.ALL])
+                stream.overlays.set_enabled(
+                    "flow", viz in [VisualizationType.OPTICAL_FLOW, VisualizationType.ALL])
+                stream.overlays.set_enabled("hud", self.show_hud)
+                if timing:
+                    overlay_start = time.perf_counter()
+                display_frame = stream.overlays.compose(frame)
+                if timing:
+                    self._timed(stream.timers, "overlay", overlay_start)
+                    show_start = time.perf_counter()
+
+                # -----------------------------
+                # 2. Show the frame
+                # -----------------------------
+                if self.headless:
+                    self.preview.publish(name, display_frame)
+                else:
+                    cv2.imshow(stream.window_name, display_frame)
+                if timing:
+                    self._timed(stream.timers, "show", show_start)
+                stream.stage_rates["display"].tick()
 
             # -----------------------------
-            # 5. Handle keyboard input
+            # 3. Handle keyboard input (also keeps the windows responsive)
             # -----------------------------
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q'):
-                break
+            if not self.headless:
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    break
+
+            # Hold the display to its own rate
+            remaining = interval - (time.time() - loop_start)
+            if new_frames and remaining > 0:
+                time.sleep(remaining)
 
         # Cleanup
         self.stop()
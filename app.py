@@ -52,6 +52,8 @@ async def websocket_feed(websocket: WebSocket):
         while True:
             # 1) Wait for text from the client (JSON)
             raw_message = await websocket.receive_text()
+            t_recv = time.time()
+            stages = {}
             data = json.loads(raw_message)
 
             # 2) Parse fields: goal (initial), base64 image (always)
@@ -66,7 +68,8 @@ async def websocket_feed(websocket: WebSocket):
                 print("[Warning] No base64 image provided.")
                 await websocket.send_json({
                     "type": "error",
-                    "message": "No base64 image provided"
+                    "message": "No base64 image provided",
+                    "trace": build_trace(data, t_recv, stages)
                 })
                 continue
 
@@ -74,16 +77,19 @@ async def websocket_feed(websocket: WebSocket):
             filename = None
             if image_base64:
                 try:
+                    stage_start = time.time()
                     image_bytes = base64.b64decode(image_base64)
                     filename = f"frame_{int(time.time())}.jpg"
                     with open(filename, "wb") as f:
                         f.write(image_bytes)
+                    stages["decode_ms"] = (time.time() - stage_start) * 1000.0
                     print(f"Decoded image written to: {filename}")
                 except Exception as e:
                     print(f"Error decoding base64 image: {e}")
                     await websocket.send_json({
                         "type": "error",
-                        "message": "Could not decode base64 image"
+                        "message": "Could not decode base64 image",
+                        "trace": build_trace(data, t_recv, stages)
                     })
                     continue
 
@@ -105,7 +111,9 @@ async def websocket_feed(websocket: WebSocket):
             )
 
             # 6) Create the file attachment from the new image
+            stage_start = time.time()
             file_attachment = genai.upload_file(filename)
+            stages["upload_ms"] = (time.time() - stage_start) * 1000.0
 
             # 7) If we've never sent the flight prompt, send prompt + image
             #    Otherwise, only send the image
@@ -117,8 +125,10 @@ async def websocket_feed(websocket: WebSocket):
                 parts = [file_attachment]
                 print("Sending only the image to Gemini (no repeated flight prompt)...")
 
+            stage_start = time.time()
             response = chat.send_message(parts)
             gemini_response = response.text
+            stages["model_ms"] = (time.time() - stage_start) * 1000.0
             print(f"[Flight Instruction] Gemini response:\n{gemini_response}")
 
             # 8) Check for "GOAL COMPLETED"
@@ -126,7 +136,8 @@ async def websocket_feed(websocket: WebSocket):
                 # Send a special message to the client
                 await websocket.send_json({
                     "type": "goal_completed",
-                    "message": "Gemini indicates that the goal has been accomplished."
+                    "message": "Gemini indicates that the goal has been accomplished.",
+                    "trace": build_trace(data, t_recv, stages)
                 })
                 # Clean up, then break out of the loop
                 if filename and os.path.exists(filename):
@@ -134,12 +145,15 @@ async def websocket_feed(websocket: WebSocket):
                 break
 
             # 9) Otherwise, proceed to extract flight instruction
+            stage_start = time.time()
             flight_instruction = extract_flight_instruction(gemini_response)
+            stages["parse_ms"] = (time.time() - stage_start) * 1000.0
 
             # 10) Send flight instruction to the client
             await websocket.send_json({
                 "type": "flight_instruction",
-                "data": flight_instruction
+                "data": flight_instruction,
+                "trace": build_trace(data, t_recv, stages)
             })
 
             # 11) Clean up the local image file
@@ -157,6 +171,20 @@ async def websocket_feed(websocket: WebSocket):
         print("Error in WebSocket loop:", e)
 
 
+def build_trace(data: dict, t_recv: float, stages: dict) -> dict:
+    """
+    Echo the client's frame sequence ID and capture timestamp together with
+    this server's per-stage timings (ms), so the client can split its
+    end-to-end latency into encode, network, server and model time.
+    """
+    return {
+        "seq": data.get("seq"),
+        "t_capture": data.get("t_capture"),
+        "stages": dict(stages),
+        "server_ms": (time.time() - t_recv) * 1000.0
+    }
+
+
 def extract_flight_instruction(gemini_response: str) -> dict:
     """
     Extracts the flight instruction JSON from Gemini's response.
@@ -1,5 +1,7 @@
 import cv2
 import numpy as np
+import os
+import sys
 import time
 from datetime import datetime
 import base64
@@ -7,6 +9,392 @@ import json
 import asyncio
 import websockets
 import threading
+from collections import deque
+
+# Shared modules (autopilot, flight recorder) live next to this script in "Jan 11 Controller"
+CONTROLLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Jan 11 Controller")
+if CONTROLLER_DIR not in sys.path:
+    sys.path.insert(0, CONTROLLER_DIR)
+
+from flight_recorder import FlightRecorder
+from camera_discovery import find_receiver
+
+
+################################################################################
+#                       LATENCY TRACING                                        #
+################################################################################
+
+class LatencyTracker:
+    """
+    Rolling glass-to-instruction latency for frames sent to the backend.
+
+    Every captured frame is stamped with a sequence ID and capture time. The
+    server echoes both back with its own stage timings, so each completed
+    sample splits into encode, network, server and model time (all in ms)
+    using only the client's clock. Network is whatever is left over once the
+    encode and server time are taken out, so it covers both directions.
+    """
+    STAGES = ("encode", "network", "server", "model")
+    BUCKETS_MS = (100, 250, 500, 1000, 2000, 5000)
+
+    def __init__(self, window=100, log_interval=10.0, pending_timeout=60.0):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+        self.pending = {}
+        self.next_seq = 0
+        self.log_interval = log_interval
+        self.pending_timeout = pending_timeout
+        self.last_log = time.time()
+
+    def stamp(self):
+        """Allocate a sequence ID and capture timestamp for a frame just read"""
+        t_capture = time.time()
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+        return {"seq": seq, "t_capture": t_capture}
+
+    def mark_sent(self, trace, encode_ms):
+        """Remember a frame that has been encoded and handed to the socket"""
+        now = time.time()
+        with self.lock:
+            # Forget frames the server never answered
+            stale = [seq for seq, p in self.pending.items()
+                     if now - p["t_capture"] > self.pending_timeout]
+            for seq in stale:
+                del self.pending[seq]
+            self.pending[trace["seq"]] = {
+                "t_capture": trace["t_capture"],
+                "encode_ms": encode_ms,
+            }
+
+    def complete(self, echoed):
+        """Close out a frame using the trace echoed by the server"""
+        now = time.time()
+        seq = echoed.get("seq")
+        with self.lock:
+            sent = self.pending.pop(seq, None)
+            if sent is None:
+                return None
+
+            total_ms = (now - sent["t_capture"]) * 1000.0
+            server_total_ms = float(echoed.get("server_ms", 0.0))
+            model_ms = float(echoed.get("stages", {}).get("model_ms", 0.0))
+            sample = {
+                "seq": seq,
+                "total": total_ms,
+                "encode": sent["encode_ms"],
+                "network": max(0.0, total_ms - sent["encode_ms"] - server_total_ms),
+                "server": max(0.0, server_total_ms - model_ms),
+                "model": model_ms,
+            }
+            self.samples.append(sample)
+        return sample
+
+    def summary(self):
+        """Percentiles, per-stage means and a histogram over the rolling window"""
+        with self.lock:
+            samples = list(self.samples)
+        if not samples:
+            return None
+
+        totals = np.array([s["total"] for s in samples])
+        edges = [0, *self.BUCKETS_MS, np.inf]
+        counts, _ = np.histogram(totals, bins=edges)
+        return {
+            "count": len(samples),
+            "p50": float(np.percentile(totals, 50)),
+            "p95": float(np.percentile(totals, 95)),
+            "max": float(totals.max()),
+            "means": {stage: float(np.mean([s[stage] for s in samples]))
+                      for stage in self.STAGES},
+            "histogram": list(zip(self._bucket_labels(), counts.tolist())),
+        }
+
+    def _bucket_labels(self):
+        labels = [f"<{b}" for b in self.BUCKETS_MS]
+        labels.append(f">={self.BUCKETS_MS[-1]}")
+        return labels
+
+    def format_summary(self, summary=None):
+        """One-line text form of summary(), used for the log and the overlay"""
+        summary = summary or self.summary()
+        if summary is None:
+            return "latency: no samples yet"
+        means = summary["means"]
+        stages = " ".join(f"{stage} {means[stage]:.0f}" for stage in self.STAGES)
+        return (f"latency n={summary['count']} p50={summary['p50']:.0f}ms "
+                f"p95={summary['p95']:.0f}ms max={summary['max']:.0f}ms | {stages}")
+
+    def maybe_log(self):
+        """Print the summary line at most once every log_interval seconds"""
+        now = time.time()
+        if now - self.last_log < self.log_interval:
+            return
+        self.last_log = now
+        summary = self.summary()
+        if summary is None:
+            return
+        histogram = " ".join(f"{label}:{count}" for label, count in summary["histogram"])
+        print(f"[LAT] {self.format_summary(summary)} | hist(ms) {histogram}")
+
+    def draw(self, frame):
+        """Return a copy of frame with the latency breakdown drawn in the corner"""
+        summary = self.summary()
+        if summary is None:
+            return frame
+
+        display_frame = frame.copy()
+        lines = [self.format_summary(summary)]
+        lines.append(" ".join(f"{label}:{count}" for label, count in summary["histogram"]))
+        for i, line in enumerate(lines):
+            cv2.putText(display_frame, line, (10, 25 + 22 * i),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 255, 255), 2)
+        return display_frame
+
+
+# Shared between the capture loop and the WebSocket receive thread
+latency_tracker = LatencyTracker()
+
+
+################################################################################
+#                       INSTRUCTION EXECUTION                                  #
+################################################################################
+
+class FrameSlot:
+    """
+    Most recent captured frame and its trace, written by the capture loop and
+    read by the instruction executor.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.frame = None
+        self.trace = None
+
+    def update(self, frame, trace):
+        """Publish a freshly captured frame"""
+        with self.cond:
+            self.frame = frame
+            self.trace = trace
+            self.cond.notify_all()
+
+    def wait_newer(self, t, timeout=1.0):
+        """Wait for a frame captured after time t; returns (None, None) on timeout"""
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.trace is None or self.trace["t_capture"] <= t:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, None
+                self.cond.wait(remaining)
+            return self.frame, self.trace
+
+
+class InstructionExecutor:
+    """
+    Flies server instructions on a dedicated thread so capture, upload and the
+    model's thinking are not serialized behind the blocking autopilot calls.
+
+    - As soon as an action finishes, the first frame captured after it is sent
+      to the backend, so the next instruction is already being computed.
+    - With mid_action_frames enabled, long actions also send a frame halfway
+      through; the model thinks while the drone is still flying, and its
+      answer supersedes whatever is left of the current action.
+    - A newer instruction always supersedes the current one: the running
+      action is cancelled through the autopilot's cancel_event and the new
+      one starts immediately.
+    """
+    FIELD_OF_VIEW = 90    # degrees, matches the flight prompt in app.py
+    YAW_RATE = 30         # degrees/second, matches WiFiController.rotate
+    CLIMB_RATE = 0.5      # m/s, rough altitude controller response
+    MIN_TURN = 2.0        # degrees; smaller heading corrections are skipped
+
+    def __init__(self, drone, frame_slot, goal="explore the city", velocity=0.5,
+                 settle_time=0.3, mid_action_frames=False, mid_action_min_duration=2.0):
+        self.drone = drone
+        self.frame_slot = frame_slot
+        self.goal = goal
+        self.velocity = velocity
+        self.settle_time = settle_time
+        self.mid_action_frames = mid_action_frames
+        self.mid_action_min_duration = mid_action_min_duration
+
+        self.cond = threading.Condition()
+        self.cancel_event = threading.Event()
+        self.pending = None
+        self.busy = False
+        self.running = False
+        self.thread = None
+        self.mid_action_sent = False
+
+    def start(self):
+        """Start the executor thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print("[EXEC] Instruction executor started")
+
+    def stop(self):
+        """Cancel any running action and stop the executor thread"""
+        with self.cond:
+            self.running = False
+            self.pending = None
+            self.cancel_event.set()
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=5.0)
+            self.thread = None
+        print("[EXEC] Instruction executor stopped")
+
+    def submit(self, instruction):
+        """Queue an instruction, superseding the one currently flying"""
+        with self.cond:
+            if self.busy:
+                print(f"[EXEC] New instruction {instruction} supersedes the current action")
+                self.cancel_event.set()
+            self.pending = instruction
+            self.cond.notify_all()
+
+    def cancel(self):
+        """Abort the current action and drop anything queued"""
+        with self.cond:
+            self.pending = None
+            self.cancel_event.set()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and self.pending is None:
+                    self.cond.wait()
+                if not self.running:
+                    break
+                instruction = self.pending
+                self.pending = None
+                self.cancel_event.clear()
+                self.busy = True
+                self.mid_action_sent = False
+
+            try:
+                # Into the flight recording, next to the frames it was decided on
+                self.drone.record_decision(instruction)
+                completed = self._execute(instruction)
+            except Exception as e:
+                print(f"[EXEC] Error executing {instruction}: {e}")
+                completed = False
+
+            with self.cond:
+                self.busy = False
+                superseded = self.pending is not None
+
+            # A mid-action frame is already being answered; don't ask twice
+            if completed and not superseded and not self.mid_action_sent:
+                self._send_post_action_frame()
+
+    def can_elevate(self):
+        """True if "e" instructions can be flown: they move the altitude hold target"""
+        controller = getattr(self.drone, "altitude_controller", None)
+        return controller is not None and controller.running
+
+    def _execute(self, instruction):
+        """Fly one instruction; returns False if it failed or was cancelled"""
+        print(f"[EXEC] Executing {instruction}")
+
+        if "r" in instruction:
+            degrees = float(instruction["r"])
+            return self._timed(abs(degrees) / self.YAW_RATE,
+                               lambda: self.drone.rotate(degrees, cancel_event=self.cancel_event))
+
+        if "e" in instruction:
+            meters = float(instruction["e"])
+            if not self.can_elevate():
+                # Only the autopilot's own flight path (takeoff / start_control_systems) runs altitude hold
+                print(f"[EXEC] Rejecting {instruction}: altitude hold is not running on this drone, "
+                      f"so the altitude target can't be changed")
+                return False
+            if not self.drone.elevate(meters):
+                return False
+            # The altitude controller chases the new target; give it time to get there
+            return self._timed(abs(meters) / self.CLIMB_RATE,
+                               lambda: not self.cancel_event.wait(abs(meters) / self.CLIMB_RATE))
+
+        if "g" in instruction:
+            (x_center, _), distance = instruction["g"]
+            heading = (float(x_center) - 0.5) * self.FIELD_OF_VIEW
+            distance = float(distance)
+            turn_time = abs(heading) / self.YAW_RATE if abs(heading) >= self.MIN_TURN else 0.0
+
+            def go_to():
+                if turn_time and not self.drone.rotate(heading, cancel_event=self.cancel_event):
+                    return False
+                if self.cancel_event.is_set():
+                    return False
+                if distance <= 0:
+                    return True
+                result = self.drone.move_forward_precise(
+                    distance, self.velocity, cancel_event=self.cancel_event)
+                return result.get("success", False)
+
+            return self._timed(turn_time + distance / self.velocity, go_to)
+
+        print(f"[EXEC] Unsupported instruction: {instruction}")
+        return False
+
+    def _timed(self, duration, action):
+        """Run a blocking action, sending a mid-action frame halfway through if enabled"""
+        timer = None
+        if self.mid_action_frames and duration >= self.mid_action_min_duration:
+            timer = threading.Timer(duration / 2.0, self._send_mid_action_frame)
+            timer.daemon = True
+            timer.start()
+        try:
+            return bool(action()) and not self.cancel_event.is_set()
+        finally:
+            if timer:
+                timer.cancel()
+
+    def _send_mid_action_frame(self):
+        if self.cancel_event.is_set():
+            return
+        frame, trace = self.frame_slot.wait_newer(time.time() - 0.1, timeout=0.5)
+        if frame is None:
+            return
+        self.mid_action_sent = True
+        print(f"[EXEC] Sending mid-action frame {trace['seq']}")
+        send_frame_in_thread(frame, self.goal, trace)
+
+    def _send_post_action_frame(self):
+        # Let the airframe settle, then take the first frame captured after that
+        if self.cancel_event.wait(self.settle_time):
+            return
+        frame, trace = self.frame_slot.wait_newer(time.time())
+        if frame is None:
+            print("[EXEC] No post-action frame available")
+            return
+        print(f"[EXEC] Sending post-action frame {trace['seq']}")
+        send_frame_in_thread(frame, self.goal, trace)
+
+
+# Set by main() when an autopilot is connected
+instruction_executor = None
+
+def connect_autopilot():
+    """
+    Connect to the drone through the autopilot in 'Jan 11 Controller'.
+    Returns the connected WiFiController, or None if it is unavailable.
+    """
+    try:
+        from autopilot import WiFiController
+    except ImportError as e:
+        print(f"[EXEC] Could not import autopilot: {e}")
+        return None
+
+    drone = WiFiController()
+    if not drone.connect():
+        print("[EXEC] Could not connect to the drone.")
+        return None
+    return drone
 
 
 ################################################################################
@@ -15,6 +403,10 @@ import threading
 
 # Global variable for storing an open WebSocket connection
 ws_connection = None
+# FlightRecorder for the current session, if recording
+flight_recorder = None
+# Event loop the WebSocket client runs on (owned by the background thread)
+ws_loop = None
 
 async def connect_to_backend(uri="ws://localhost:8000/feed"):
     """
@@ -61,12 +453,26 @@ def handle_server_message(message: str):
     #  { "type": "goal_completed", "message": "..." }
     #  { "type": "error", "message": "..." }
     msg_type = msg_json.get("type", "")
+    if flight_recorder is not None:
+        flight_recorder.record_event(f"server.{msg_type or 'unknown'}", msg_json)
+
+    # Close out the latency sample for the frame this message answers
+    trace = msg_json.get("trace")
+    if trace:
+        sample = latency_tracker.complete(trace)
+        if sample:
+            print(f"[WS] Frame {sample['seq']} answered in {sample['total']:.0f}ms")
+
     if msg_type == "flight_instruction":
         flight_instr = msg_json.get("data", {})
         print("[WS] >>> Flight instruction from server:", flight_instr)
+        if instruction_executor is not None and flight_instr:
+            instruction_executor.submit(flight_instr)
 
     elif msg_type == "goal_completed":
         print("[WS] >>> GOAL COMPLETED message from server:", msg_json.get("message", ""))
+        if instruction_executor is not None:
+            instruction_executor.cancel()
 
     elif msg_type == "error":
         print("[WS] >>> ERROR from server:", msg_json.get("message", ""))
@@ -76,15 +482,19 @@ def handle_server_message(message: str):
         print("[WS] >>> Unrecognized message type from server:", msg_json)
 
 
-async def send_frame_to_backend(frame, goal="explore the city"):
+async def send_frame_to_backend(frame, goal="explore the city", trace=None):
     """
     Send a single frame + goal to the backend via the open WebSocket connection.
+    If a trace (from latency_tracker.stamp()) is given it travels with the
+    frame so the server can echo it back.
     """
     global ws_connection
     if not ws_connection:
         print("[WS] No active WebSocket connection. Cannot send frame.")
         return
 
+    encode_start = time.time()
+
     # 1) Encode frame as JPEG in memory
     success, buffer = cv2.imencode(".jpg", frame)
     if not success:
@@ -100,6 +510,13 @@ async def send_frame_to_backend(frame, goal="explore the city"):
         "goal": goal,
         "image": image_b64
     }
+    if trace:
+        message["seq"] = trace["seq"]
+        message["t_capture"] = trace["t_capture"]
+        latency_tracker.mark_sent(trace, (time.time() - encode_start) * 1000.0)
+    if flight_recorder is not None:
+        flight_recorder.record_event("frame_sent", {"goal": goal, "trace": trace})
+
     # 4) Send JSON message
     try:
         await ws_connection.send(json.dumps(message))
@@ -112,7 +529,9 @@ def start_websocket_client():
     Start the background thread that runs an asyncio event loop.
     It connects to the WebSocket server and keeps listening/receiving.
     """
+    global ws_loop
     loop = asyncio.new_event_loop()
+    ws_loop = loop
 
     def run_loop_forever():
         asyncio.set_event_loop(loop)
@@ -123,29 +542,31 @@ def start_websocket_client():
     t = threading.Thread(target=run_loop_forever, daemon=True)
     t.start()
 
-def send_frame_in_thread(frame, goal="explore the city"):
+def send_frame_in_thread(frame, goal="explore the city", trace=None):
     """
     Thread-safe helper to schedule 'send_frame_to_backend' coroutine
     on the already-running event loop.
     """
-    loop = asyncio.get_event_loop()
-    # If there's a running event loop, schedule the coroutine in it
-    if loop.is_running():
-        asyncio.run_coroutine_threadsafe(send_frame_to_backend(frame, goal), loop)
-    else:
-        # Fallback if for some reason the loop isn't recognized
-        asyncio.run_coroutine_threadsafe(send_frame_to_backend(frame, goal), asyncio.get_event_loop())
+    # The WebSocket loop lives on its own thread; asyncio.get_event_loop()
+    # from the capture thread would hand back a different, idle loop.
+    loop = ws_loop
+    if loop is None or not loop.is_running():
+        print("[WS] WebSocket event loop is not running. Cannot send frame.")
+        return
+    asyncio.run_coroutine_threadsafe(send_frame_to_backend(frame, goal, trace), loop)
 
 
 ################################################################################
 #                        OPEN CV CAPTURE CODE                                  #
 ################################################################################
 
-def setup_video_capture(device_id=1):
+def setup_video_capture(device_id=None):
     """
     Set up video capture from the Skydroid receiver.
-    Try different device_id values (0, 1, 2...) if not detected.
+    By default the receiver is auto-detected; pass a device_id (0, 1, 2...) to override.
     """
+    if device_id is None:
+        device_id = find_receiver()
     cap = cv2.VideoCapture(device_id)
     
     if not cap.isOpened():
@@ -164,9 +585,14 @@ def capture_frame(cap):
         raise RuntimeError("Failed to capture frame")
     return frame
 
-def save_frame(frame, output_dir="captured_frames"):
-    """Save a frame to disk with timestamp."""
-    import os
+def save_frame(frame, output_dir="captured_frames", recorder=None):
+    """
+    Save a frame to disk with timestamp. With a running recorder the write
+    happens on its background thread instead of the caller's.
+    """
+    if recorder is not None and recorder.running:
+        return recorder.save_jpeg(frame, output_dir)
+
     os.makedirs(output_dir, exist_ok=True)
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
@@ -174,20 +600,62 @@ def save_frame(frame, output_dir="captured_frames"):
     cv2.imwrite(filename, frame)
     return filename
 
-def main():
+def start_flight_recording(drone=None):
+    """
+    Start a FlightRecorder for the client's frames; with a connected drone,
+    its MAVLink telemetry and flown instructions go into the same flight.
+    """
+    recorder = FlightRecorder(max_fps=10).start()
+    if drone is not None:
+        drone.start_recording(recorder=recorder)
+    return recorder
+
+def stop_flight_recording(recorder, drone=None):
+    """Detach recorder from the drone (if any) and close the flight"""
+    if drone is not None and drone.flight_recorder is recorder:
+        drone.stop_recording()
+    recorder.stop()
+
+def main(fly=False):
+    """
+    Run the capture loop. With fly=True the drone is connected and server
+    instructions are flown by an InstructionExecutor; otherwise they are
+    only printed. Flights are recorded automatically; 'r' toggles recording.
+    """
+    global instruction_executor, flight_recorder
+
     # 1) Start our background WebSocket client thread
     start_websocket_client()
 
+    frame_slot = FrameSlot()
+    drone = None
+    if fly:
+        drone = connect_autopilot()
+        if drone is not None:
+            instruction_executor = InstructionExecutor(drone, frame_slot)
+            instruction_executor.start()
+            if not instruction_executor.can_elevate():
+                print("Altitude hold is not running: 'e' instructions will be rejected.")
+            flight_recorder = start_flight_recording(drone)
+        else:
+            print("Flying disabled: instructions will only be printed.")
+
     try:
         # 2) Initialize video capture
         cap = setup_video_capture()
-        print("Video capture started. Press 'q' to quit, 's' to save a frame, 'u' to send a frame.")
+        print("Video capture started. Press 'q' to quit, 's' to save a frame, 'u' to send a frame, "
+              "'r' to start/stop recording.")
 
         while True:
             frame = capture_frame(cap)
+            trace = latency_tracker.stamp()
+            frame_slot.update(frame, trace)
+            if flight_recorder is not None:
+                flight_recorder.record_frame(frame, trace["t_capture"], trace["seq"])
             
-            # Display the frame
-            cv2.imshow('Drone Video Feed', frame)
+            # Display the frame with the latency breakdown on top
+            cv2.imshow('Drone Video Feed', latency_tracker.draw(frame))
+            latency_tracker.maybe_log()
 
             # Handle keyboard input
             key = cv2.waitKey(1) & 0xFF
@@ -196,19 +664,37 @@ def main():
                 break
             elif key == ord('s'):
                 # Save a frame locally
-                filename = save_frame(frame)
-                print(f"Saved frame to {filename}")
+                filename = save_frame(frame, recorder=flight_recorder)
+                if filename:
+                    print(f"Saved frame to {filename}")
+                else:
+                    print("Recorder is behind; frame not saved")
+            elif key == ord('r'):
+                # Toggle the flight recorder
+                if flight_recorder is None:
+                    flight_recorder = start_flight_recording(drone)
+                else:
+                    stop_flight_recording(flight_recorder, drone)
+                    flight_recorder = None
             elif key == ord('u'):
                 # **NEW**: Send a frame (plus the default goal) to the backend
                 print("Sending frame to backend...")
-                send_frame_in_thread(frame, goal="explore the city")
+                send_frame_in_thread(frame, goal="explore the city", trace=trace)
 
     except Exception as e:
         print(f"Error: {e}")
     finally:
+        if instruction_executor is not None:
+            instruction_executor.stop()
+            instruction_executor = None
+        if flight_recorder is not None:
+            stop_flight_recording(flight_recorder, drone)
+            flight_recorder = None
+        if drone is not None:
+            drone.disconnect()
         if 'cap' in locals():
             cap.release()
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
+    main(fly="--fly" in sys.argv)